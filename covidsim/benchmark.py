@@ -0,0 +1,207 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# Needed for timing, and for reading and writing results
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+# Needed for setting up the cases and summarizing the times
+import numpy as np
+# The model we're timing
+from model import Model
+
+
+# Times the pieces of the model across population sizes and densities
+# Each case sets up a model with some fraction of the population infected, then
+#  times one phase of a step over and over. The results can be written to a
+#  JSON file, and compared against a baseline from an earlier run to catch
+#  anything that got slower. Nothing here touches matplotlib, so it runs
+#  headless.
+
+
+# The phases of a step that can be timed, and how to run each of them
+PHASES: Dict[str, Callable[[Model], Any]] = {
+    'people_transmitting': lambda model: model.people_transmitting(),
+    'tick_locations': lambda model: model.tick_locations(),
+    'tick_healths': lambda model: model.tick_healths(),
+    'step': lambda model: model.step(),
+}
+
+# What identifies a result, for matching it up against the baseline
+KEY: List[str] = ['phase', 'pop_size', 'density', 'infected_fraction', 'contact_backend', 'compact']
+
+
+# Every combination of the settings given
+def cases(
+  phases: List[str],
+  pop_sizes: List[int],
+  densities: List[float],
+  infected_fractions: List[float],
+  backends: List[str],
+  compact: List[bool],
+) -> Iterator[Dict[str, Any]]:
+    for values in itertools.product(phases, pop_sizes, densities, infected_fractions, backends, compact):
+        yield dict(zip(KEY, values))
+
+# Creates the model for a case
+# The density is in people per unit area, which sets the size of the map. The
+#  infected people get their infections spread out over the whole infection
+#  time, like they would be partway through an epidemic.
+def make_model(case: Dict[str, Any], seed: int = 0) -> Model:
+    model: Model = \
+        Model(
+            pop_size=case['pop_size'],
+            map_size=np.sqrt(case['pop_size'] / case['density']),
+            contact_backend=case['contact_backend'],
+            compact=case['compact'],
+            initial_cases=0,
+            seed=seed)
+    infected: np.ndarray = \
+        np.sort(model.rng.choice(
+            model.pop_size,
+            size=int(case['infected_fraction'] * model.pop_size),
+            replace=False))
+    model.healths[infected] = Model.INFECTED
+    ends: np.ndarray = model.rng.integers(model.infection_time, size=len(infected))
+    for end in range(model.infection_time):
+        model.schedule(infected[ends == end], end)
+    return model
+
+# Times one case
+# The phase is run once to warm up, then as many times as fit in the time
+#  budget, between some minimum and maximum number of repeats. Running a phase
+#  changes the model, so every run starts from a fresh copy of the same model.
+#  Otherwise the infections would pile up and later runs wouldn't be timing the
+#  case any more. Peak memory is measured on one more run on its own, since
+#  tracing allocations slows everything down.
+def run_case(
+  case: Dict[str, Any],
+  budget: float = 1.0,
+  min_repeats: int = 3,
+  max_repeats: int = 100,
+) -> Dict[str, Any]:
+    state: Dict[str, np.ndarray] = make_model(case).state()
+    phase: Callable[[Model], Any] = PHASES[case['phase']]
+    phase(Model.from_state(state))
+    times: List[float] = []
+    while len(times) < max_repeats and \
+      (len(times) < min_repeats or sum(times) < budget):
+        model: Model = Model.from_state(state)
+        start: float = time.perf_counter()
+        phase(model)
+        times.append(time.perf_counter() - start)
+    model = Model.from_state(state)
+    tracemalloc.start()
+    phase(model)
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        **case,
+        'seconds': float(np.median(times)),
+        'min_seconds': float(np.min(times)),
+        'repeats': len(times),
+        'per_second': 1 / float(np.median(times)),
+        'peak_bytes': peak,
+    }
+
+
+# Runs every case and collects the results, along with where they were run
+def run_benchmarks(all_cases: List[Dict[str, Any]], budget: float = 1.0) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+    for i, case in enumerate(all_cases):
+        results.append(run_case(case, budget))
+        print(f"({i+1}/{len(all_cases)}) {describe(results[-1])}", file=sys.stderr)
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+        },
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+def describe(result: Dict[str, Any]) -> str:
+    return \
+        f"{result['phase']} pop_size={result['pop_size']} density={result['density']} " \
+        f"infected={result['infected_fraction']} backend={result['contact_backend']}" \
+        f"{' compact' if result['compact'] else ''}: " \
+        f"{result['seconds']*1000:.3f} ms ({result['per_second']:.1f}/s), " \
+        f"peak {result['peak_bytes']/2**20:.1f} MiB"
+
+# Compares results against a baseline
+# Returns a line for every result that took more than `threshold` longer than
+#  it did in the baseline, as a fraction, and another for every result that
+#  had nothing to match in the baseline
+def compare(
+  current: Dict[str, Any],
+  baseline: Dict[str, Any],
+  threshold: float = 0.2,
+) -> Tuple[List[str], List[str]]:
+    def key(result: Dict[str, Any]) -> Tuple:
+        return tuple(result[k] for k in KEY)
+    before: Dict[Tuple, Dict[str, Any]] = {key(r): r for r in baseline['results']}
+    regressions: List[str] = []
+    unmatched: List[str] = []
+    for result in current['results']:
+        old: Dict[str, Any] = before.get(key(result))
+        if old is None:
+            unmatched.append(describe(result))
+            continue
+        # The fastest run is the one least thrown off by whatever else the
+        #  machine was doing
+        ratio: float = result['min_seconds'] / old['min_seconds']
+        if ratio > 1 + threshold:
+            regressions.append(f"{describe(result)} is {ratio:.2f}x the baseline")
+    return regressions, unmatched
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the pieces of the model')
+    parser.add_argument('--out', default=None, help='JSON file to write the results to')
+    parser.add_argument('--baseline', default=None, help='JSON file from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='How much slower counts as a regression, as a fraction')
+    parser.add_argument('--budget', type=float, default=1.0, help='Seconds to spend timing each case')
+    parser.add_argument('--phases', nargs='+', default=list(PHASES), choices=list(PHASES))
+    parser.add_argument('--pop-sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.5, 5.0], help='People per unit area')
+    parser.add_argument('--infected', type=float, nargs='+', default=[0.01, 0.2], help='Fractions of people infected')
+    parser.add_argument('--backends', nargs='+', default=['auto'], help='Contact backends to use')
+    parser.add_argument('--compact', action='store_true', help='Also time the compact storage mode')
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = \
+        run_benchmarks(
+            list(cases(
+                args.phases,
+                args.pop_sizes,
+                args.densities,
+                args.infected,
+                args.backends,
+                [False, True] if args.compact else [False])),
+            args.budget)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions, unmatched = compare(results, json.load(f), args.threshold)
+        for case in unmatched:
+            print(f"Not in the baseline: {case}")
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        # Comparing against nothing shouldn't look like a pass
+        if len(unmatched) == len(results['results']):
+            print("Nothing matched the baseline")
+            sys.exit(1)
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,153 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Any, Dict, List, Union
+
+# Needed for reading arguments and writing the report
+import argparse
+import sys
+import time
+
+# Needed for averaging the runs and comparing the curves
+import numpy as np
+# The model we're calibrating
+from model import Model
+# The backend we're calibrating
+from contact import DensityBackend
+
+
+# Checks how far epidemics run with the approximate density backend are from
+#  ones run with an exact backend
+# Each setting is run a number of times with each backend, with the same seeds
+#  for both, until the epidemic dies out. The report compares the averages of
+#  what matters: how many people are infected at the peak and when, how many
+#  catch it in the end, and how far apart the mean curves of infected people
+#  get at their worst. It's written as a Markdown table. The density backend
+#  is run at a few resolutions, to show what finer cells buy.
+
+
+# The settings compared by default
+# They go from crowded to sparse, and from everyone moving to hardly anyone
+SETTINGS: List[Dict[str, Any]] = [
+    {'pop_size': 5000, 'map_size': 100.0},
+    {'pop_size': 2000, 'map_size': 100.0},
+    {'pop_size': 5000, 'map_size': 100.0, 'p_movement': 0.3},
+    {'pop_size': 20000, 'map_size': 200.0, 'p_infect': 0.1},
+]
+
+
+# Runs one epidemic to the end, and returns its infected curve along with its
+#  final size as a fraction of the population
+def run_epidemic(
+  setting: Dict[str, Any],
+  backend: Union[str, float],
+  seed: int,
+  initial_cases: int,
+  max_ticks: int,
+) -> Dict[str, Any]:
+    # A number is the resolution of the density backend
+    if not isinstance(backend, str):
+        backend = DensityBackend(setting['map_size'], backend)
+    model: Model = \
+        Model(
+            **setting,
+            contact_backend=backend,
+            initial_cases=initial_cases,
+            seed=seed)
+    while model.time < max_ticks and (model.time == 0 or model.infected[-1] > 0):
+        model.step()
+    return {
+        'infected': model.infected / model.pop_size,
+        'final': (model.recovered[-1] + model.dead[-1]) / model.pop_size,
+    }
+
+# Summarizes a batch of epidemics run with one backend
+def summarize(runs: List[Dict[str, Any]], max_ticks: int) -> Dict[str, Any]:
+    # The curves end when the epidemics do, so pad them all out with zeros
+    curves: np.ndarray = np.zeros(shape=(len(runs), max_ticks))
+    for i, run in enumerate(runs):
+        curves[i,:len(run['infected'])] = run['infected']
+    return {
+        'curve': curves.mean(axis=0),
+        'peak': float(np.mean(curves.max(axis=1))),
+        'peak_time': float(np.mean(curves.argmax(axis=1))),
+        'final': float(np.mean([run['final'] for run in runs])),
+        'final_sd': float(np.std([run['final'] for run in runs])),
+    }
+
+# Compares the density backend at each resolution against the exact one, on
+#  one setting
+def calibrate(
+  setting: Dict[str, Any],
+  replicates: int = 10,
+  exact: str = 'grid',
+  resolutions: List[float] = [2.0],
+  seed: int = 0,
+  initial_cases: int = 5,
+  max_ticks: int = 500,
+) -> Dict[str, Any]:
+    result: Dict[str, Any] = {'setting': setting}
+    for backend in [exact] + resolutions:
+        started: float = time.perf_counter()
+        runs: List[Dict[str, Any]] = [
+            run_epidemic(setting, backend, seed + r, initial_cases, max_ticks)
+            for r in range(replicates)
+        ]
+        result[backend] = summarize(runs, max_ticks)
+        result[backend]['seconds'] = (time.perf_counter() - started) / replicates
+        result[backend]['curve_gap'] = \
+            float(np.max(np.abs(result[backend]['curve'] - result[exact]['curve'])))
+    return result
+
+
+# Lays out the results as a Markdown report
+def report(
+  results: List[Dict[str, Any]],
+  exact: str,
+  resolutions: List[float],
+  replicates: int,
+) -> str:
+    lines: List[str] = [
+        '# Density backend calibration',
+        '',
+        f"Each setting was run {replicates} times with the exact `{exact}` "
+        "backend and the approximate `density` backend, with the same seeds. "
+        "The density backend's resolution is the number of cells across the "
+        "infection distance. Fractions are of the whole population, and times "
+        "are in timesteps. The curve gap is the furthest the mean infected "
+        "curve gets from the exact one.",
+        '',
+        '| Setting | Backend | Peak infected | Peak time | Final size | Curve gap | Seconds per run |',
+        '|---|---|---|---|---|---|---|',
+    ]
+    for result in results:
+        setting: str = ', '.join(f'{k}={v}' for k, v in result['setting'].items())
+        for backend in [exact] + resolutions:
+            s: Dict[str, Any] = result[backend]
+            name: str = backend if isinstance(backend, str) else f'density, resolution {backend:g}'
+            lines.append(
+                f"| {setting} | {name} | {s['peak']:.3f} | {s['peak_time']:.1f} | "
+                f"{s['final']:.3f} ± {s['final_sd']:.3f} | {s['curve_gap']:.3f} | {s['seconds']:.2f} |")
+    return '\n'.join(lines) + '\n'
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the density backend against an exact one')
+    parser.add_argument('--out', default=None, help='Markdown file to write the report to')
+    parser.add_argument('--replicates', type=int, default=10)
+    parser.add_argument('--exact', default='grid', help='Exact contact backend to compare against')
+    parser.add_argument('--resolutions', type=float, nargs='+', default=[2.0, 3.0],
+                        help='Resolutions of the density backend to try')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    for setting in SETTINGS:
+        results.append(calibrate(setting, args.replicates, args.exact, args.resolutions, args.seed))
+        print(f"Done with {setting}", file=sys.stderr)
+    text: str = report(results, args.exact, args.resolutions, args.replicates)
+    if args.out is None:
+        print(text)
+    else:
+        with open(args.out, 'w') as f:
+            f.write(text)
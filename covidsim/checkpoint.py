@@ -0,0 +1,101 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Dict, Optional
+
+# Needed for writing in the background
+import os
+import queue
+import threading
+
+# Needed for reading and writing `.npz` files
+import numpy as np
+# The model we're saving
+from model import Model
+
+
+# Saving and restoring the model's state, so long runs can survive a crash
+# A checkpoint is a single uncompressed `.npz` file holding everything from
+#  `Model.state`. Loading it back and continuing gives bit-for-bit the same run
+#  as if it had never stopped.
+
+
+# Writes some state to a checkpoint file
+# The file is written under a temporary name first and then moved into place,
+#  so a crash halfway through can never clobber the last good checkpoint
+def write_state(state: Dict[str, np.ndarray], path: str) -> None:
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **state)
+    os.replace(path + '.tmp', path)
+
+# Saves a model to a checkpoint file
+def save_checkpoint(model: Model, path: str) -> None:
+    write_state(model.state(), path)
+
+# Loads a model back from a checkpoint file
+# Pass the class of model that was saved if it wasn't a plain `Model`
+def load_checkpoint(path: str, cls: type = Model) -> Model:
+    with np.load(path) as data:
+        return cls.from_state({k: data[k] for k in data.files})
+
+
+# Checkpoints a model every so often, writing from a background thread
+# Taking the snapshot is just a copy of the arrays, so the tick loop only
+#  stalls for that long. If the model gets ahead of the disk, snapshots that
+#  haven't been written yet are replaced by newer ones.
+# Use it like
+#   with Checkpointer(model, 'run.npz', every=100) as checkpointer:
+#       for _ in range(n_ticks):
+#           model.step()
+#           checkpointer.tick()
+class Checkpointer:
+
+    def __init__(self, model: Model, path: str, every: int = 100) -> None:
+        self.model: Model = model
+        self.path: str = path
+        self.every: int = every
+        # Holds at most one snapshot waiting to be written
+        # A snapshot of `None` tells the writer to stop
+        self.pending: queue.Queue = queue.Queue(maxsize=1)
+        self.writer: threading.Thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def write_loop(self) -> None:
+        while True:
+            state: Optional[Dict[str, np.ndarray]] = self.pending.get()
+            if state is None:
+                return
+            write_state(state, self.path)
+
+    # Queues up a snapshot to be written, replacing any that hasn't been
+    #  picked up yet
+    def submit(self, state: Optional[Dict[str, np.ndarray]]) -> None:
+        while True:
+            try:
+                self.pending.put_nowait(state)
+                return
+            except queue.Full:
+                try:
+                    self.pending.get_nowait()
+                except queue.Empty:
+                    pass
+
+    # Call this after every step of the model
+    def tick(self) -> None:
+        if self.model.time % self.every == 0:
+            self.checkpoint()
+
+    # Takes a snapshot of the model right now
+    def checkpoint(self) -> None:
+        self.submit(self.model.state())
+
+    # Writes a final checkpoint and waits for everything to hit the disk
+    def close(self) -> None:
+        if self.writer.is_alive():
+            self.checkpoint()
+            self.pending.put(None)
+            self.writer.join()
+
+    def __enter__(self) -> Checkpointer:
+        return self
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -0,0 +1,550 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+# Needed for checking whether SciPy is there without importing it
+import importlib.util
+
+# Needed for efficient distance calculation
+import numpy as np
+
+
+# SciPy is only needed for the tree backend, so don't require it
+# It's slow to import, so it's only imported once a tree is actually built
+def has_scipy() -> bool:
+    return importlib.util.find_spec('scipy') is not None
+
+
+# Everything in this file answers the same question for the contact step of
+#  the simulation: given the positions of some infected people (the sources)
+#  and some healthy people (the targets), how many of the sources is each of
+#  the targets within `infection_distance` of?
+
+
+# Tests candidate (source, target) pairs for whether they're close enough to
+#  transmit. It's written the same way as the dense all-pairs computation so
+#  that every engine gives exactly the same answer.
+# Note that we compare squared distances, so there's no need for a square root
+def within(
+  source_positions: np.ndarray,
+  target_positions: np.ndarray,
+  infection_distance: np.float64,
+) -> np.ndarray:
+    dx: np.ndarray = source_positions[:,0] - target_positions[:,0]
+    dy: np.ndarray = source_positions[:,1] - target_positions[:,1]
+    return dx*dx + dy*dy <= infection_distance * infection_distance
+
+
+# Cell-list / uniform-grid neighbor search
+# Everyone gets bucketed into square cells at least `infection_distance` on a
+#  side, so a target can only be in range of sources in its own cell or one
+#  of the eight cells around it. Only those candidate pairs get tested.
+# People can optionally be split into groups, with no contact between groups.
+#  That lets lots of independent populations be searched in one pass.
+def grid_counts(
+  sources: np.ndarray,
+  targets: np.ndarray,
+  infection_distance: np.float64,
+  source_groups: np.ndarray = None,
+  target_groups: np.ndarray = None,
+) -> np.ndarray:
+    counts: np.ndarray = np.zeros(shape=(len(targets),), dtype=np.int64)
+    for _, pair_targets, hits in \
+      grid_candidates(sources, targets, infection_distance, source_groups, target_groups):
+        counts += np.bincount(pair_targets[hits], minlength=len(targets))
+    return counts
+
+# Same search, but returns the (source, target) index pairs that are in range
+#  rather than counting them
+def grid_pairs(
+  sources: np.ndarray,
+  targets: np.ndarray,
+  infection_distance: np.float64,
+  source_groups: np.ndarray = None,
+  target_groups: np.ndarray = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    found: List[Tuple[np.ndarray, np.ndarray]] = [
+        (pair_sources[hits], pair_targets[hits])
+        for pair_sources, pair_targets, hits in
+        grid_candidates(sources, targets, infection_distance, source_groups, target_groups)
+    ]
+    if len(found) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return \
+        np.concatenate([f[0] for f in found]), \
+        np.concatenate([f[1] for f in found])
+
+# Yields the candidate pairs for each column of cells around the targets, as
+#  arrays of source and target indices, along with which of them are in range
+def grid_candidates(
+  sources: np.ndarray,
+  targets: np.ndarray,
+  infection_distance: np.float64,
+  source_groups: np.ndarray = None,
+  target_groups: np.ndarray = None,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    if len(sources) == 0 or len(targets) == 0:
+        return
+
+    # Make the cells very slightly bigger than the infection distance. That
+    #  way rounding error in the division can never put two people who are in
+    #  range more than one cell apart. Bigger cells only add candidates, and
+    #  the final test is exact, so this doesn't change the answer.
+    # A distance of zero still needs some positive cell size.
+    cell_size: np.float64 = \
+        infection_distance * (1 + 1e-9) if infection_distance > 0 else 1.0
+    source_cells: np.ndarray = np.floor(sources / cell_size).astype(np.int64)
+    target_cells: np.ndarray = np.floor(targets / cell_size).astype(np.int64)
+    # Shift the cell coordinates so that every neighboring cell we look at
+    #  has nonnegative coordinates, and leave a spare row of keys so that
+    #  looking one cell up never wraps around into the next column
+    low: np.ndarray = np.minimum(source_cells.min(axis=0), target_cells.min(axis=0)) - 1
+    source_cells -= low
+    target_cells -= low
+    width: int = int(max(source_cells[:,1].max(), target_cells[:,1].max())) + 2
+    # Each group gets its own block of keys, with a spare column on either
+    #  side so looking one cell over never wraps into the next group
+    if source_groups is not None:
+        height: int = int(max(source_cells[:,0].max(), target_cells[:,0].max())) + 2
+        source_cells[:,0] += source_groups * height
+        target_cells[:,0] += target_groups * height
+
+    # Sort the sources by cell so everyone in a cell is in one contiguous run
+    source_keys: np.ndarray = source_cells[:,0] * width + source_cells[:,1]
+    order: np.ndarray = np.argsort(source_keys, kind='stable')
+    sorted_keys: np.ndarray = source_keys[order]
+    # If there aren't too many cells compared to people, build a table of
+    #  where each cell's run starts so finding a run is a direct lookup.
+    #  Otherwise fall back to binary searching the sorted keys.
+    num_keys: int = int(max(source_keys.max(), target_cells[:,0].max() * width)) + 2*width
+    run_starts: np.ndarray = None
+    if num_keys <= 8 * (len(sources) + len(targets)):
+        run_starts = \
+            np.concatenate((
+                [0],
+                np.cumsum(np.bincount(source_keys, minlength=num_keys)),
+            ))
+
+    target_idx: np.ndarray = np.arange(len(targets))
+    # Keys are laid out so that the three cells in a column around a target
+    #  are next to each other. Each column is then one contiguous run of the
+    #  sorted sources.
+    for dx in (-1, 0, 1):
+        # Find the run of sources in this column of cells around each target
+        keys: np.ndarray = (target_cells[:,0] + dx) * width + target_cells[:,1]
+        if run_starts is not None:
+            start: np.ndarray = run_starts[keys - 1]
+            stop: np.ndarray = run_starts[keys + 2]
+        else:
+            start: np.ndarray = np.searchsorted(sorted_keys, keys - 1, side='left')
+            stop: np.ndarray = np.searchsorted(sorted_keys, keys + 1, side='right')
+        run: np.ndarray = stop - start
+        # Expand the runs into flat lists of candidate pairs
+        pair_targets: np.ndarray = np.repeat(target_idx, run)
+        pair_offsets: np.ndarray = \
+            np.arange(len(pair_targets)) - np.repeat(np.cumsum(run) - run, run)
+        pair_sources: np.ndarray = order[np.repeat(start, run) + pair_offsets]
+        # Test which candidates are actually in range
+        hits: np.ndarray = \
+            within(sources[pair_sources], targets[pair_targets], infection_distance)
+        yield pair_sources, pair_targets, hits
+
+
+# Everything below wraps the different ways of doing the contact step behind
+#  one shared interface, so the simulation can swap between them and they can
+#  be cross-checked against each other.
+# Each backend takes everyone's positions, along with masks of who's infected
+#  and who's healthy, and returns an array of size (pop_size,) containing at
+#  index i the number of infected people person i is within
+#  `infection_distance` of.
+class ContactBackend:
+
+    name: str = ''
+
+    # The options this backend was created with, as keyword arguments that
+    #  JSON can hold, so that `make_backend` can create the same one again
+    def options(self) -> Dict[str, Any]:
+        return {}
+
+    # Only the infected people can infect anyone, and only the healthy people
+    #  can be infected, so we only ever look at the infected-healthy block.
+    #  Recovered and deceased people are skipped entirely, and so the cost
+    #  scales with how much of the epidemic is actually active.
+    def people_transmitting(
+      self,
+      positions: np.ndarray,
+      infected: np.ndarray,
+      healthy: np.ndarray,
+      infection_distance: np.float64,
+    ) -> np.ndarray:
+        infected_idx: np.ndarray = np.flatnonzero(infected)
+        healthy_idx: np.ndarray = np.flatnonzero(healthy)
+        if len(infected_idx) == 0 or len(healthy_idx) == 0:
+            return np.zeros(shape=(len(positions),), dtype=np.int64)
+        found: np.ndarray = \
+            self.counts(
+                positions[infected_idx],
+                positions[healthy_idx],
+                infection_distance)
+        # Approximate backends give back expected counts, which needn't be
+        #  whole numbers
+        counts: np.ndarray = np.zeros(shape=(len(positions),), dtype=found.dtype)
+        counts[healthy_idx] = found
+        return counts
+
+    # Returns an array of size (len(targets),) containing at index i the number
+    #  of sources target i is within `infection_distance` of
+    # Both arrays are guaranteed to be nonempty
+    def counts(
+      self,
+      sources: np.ndarray,
+      targets: np.ndarray,
+      infection_distance: np.float64,
+    ) -> np.ndarray:
+        raise NotImplementedError
+
+
+# Computes the distance between every infected person and every healthy person
+# This is the original way the simulation did it, and it's simple enough to be
+#  obviously right. It's still quadratic in time, but it only ever holds a
+#  block of rows of the distance matrix at once, sized to fit in a given
+#  number of bytes. That keeps the memory down to O(block * sources).
+# The distances can optionally be computed in single precision, which is
+#  faster and smaller, but won't always agree with the other backends for
+#  people right at the edge of the infection distance.
+class DenseBackend(ContactBackend):
+
+    name: str = 'dense'
+
+    def __init__(
+      self,
+      block_bytes: int = 64 * 2**20,
+      dtype: type = np.float64,
+    ) -> None:
+        self.block_bytes: int = block_bytes
+        # This can also be the name of the type
+        self.dtype: type = np.dtype(dtype).type
+
+    def options(self) -> Dict[str, Any]:
+        return {'block_bytes': self.block_bytes, 'dtype': np.dtype(self.dtype).name}
+
+    def counts(
+      self,
+      sources: np.ndarray,
+      targets: np.ndarray,
+      infection_distance: np.float64,
+    ) -> np.ndarray:
+        counts: np.ndarray = np.empty(shape=(len(targets),), dtype=np.int64)
+        sources = sources.astype(self.dtype, copy=False)
+        source_x: np.ndarray = sources[:,0]
+        source_y: np.ndarray = sources[:,1]
+        limit = self.dtype(infection_distance) * self.dtype(infection_distance)
+        # Each row of a block needs the x and y differences, the squared
+        #  distances, and whether they're in range
+        row_bytes: int = len(sources) * (3 * np.dtype(self.dtype).itemsize + 1)
+        block: int = max(1, self.block_bytes // row_bytes)
+        for start in range(0, len(targets), block):
+            rows: np.ndarray = targets[start:start+block].astype(self.dtype, copy=False)
+            # Compute the squared distance between every target in this block
+            #  and every source, reusing the buffers as we go
+            dx: np.ndarray = source_x - rows[:,0:1]
+            dy: np.ndarray = source_y - rows[:,1:2]
+            np.multiply(dx, dx, out=dx)
+            np.multiply(dy, dy, out=dy)
+            np.add(dx, dy, out=dx)
+            # Sum up how many each target can get infected from
+            counts[start:start+block] = np.count_nonzero(dx <= limit, axis=1)
+        return counts
+
+
+# Uses the uniform grid in `grid_counts`
+class GridBackend(ContactBackend):
+
+    name: str = 'grid'
+
+    def counts(
+      self,
+      sources: np.ndarray,
+      targets: np.ndarray,
+      infection_distance: np.float64,
+    ) -> np.ndarray:
+        return grid_counts(sources, targets, infection_distance)
+
+
+# Builds a KD-tree over the infected people and another over the healthy
+#  people every tick, then walks the two together to find every pair in range
+# Needs SciPy, which the rest of the simulation doesn't
+class TreeBackend(ContactBackend):
+
+    name: str = 'tree'
+
+    def __init__(self) -> None:
+        if not has_scipy():
+            raise ImportError("The tree contact backend needs scipy")
+
+    def counts(
+      self,
+      sources: np.ndarray,
+      targets: np.ndarray,
+      infection_distance: np.float64,
+    ) -> np.ndarray:
+        from scipy.spatial import cKDTree
+        # Query a tiny bit past the infection distance, then do the exact test
+        #  on the candidates. The tree measures distance its own way, which
+        #  might disagree with the other backends right at the boundary.
+        pairs: np.ndarray = \
+            cKDTree(sources).sparse_distance_matrix(
+                cKDTree(targets),
+                infection_distance * (1 + 1e-9),
+                output_type='ndarray')
+        hits: np.ndarray = \
+            within(sources[pairs['i']], targets[pairs['j']], infection_distance)
+        return np.bincount(pairs['j'][hits], minlength=len(targets))
+
+
+# Estimates the counts from how densely packed the infected people are, rather
+#  than by looking at any pairs at all
+# The map is cut into square cells a fraction of the infection distance on a
+#  side, and the infected people are counted in each cell. Blurring those counts
+#  with a disk the size of the infection distance gives, for every cell, about
+#  how many infected people are in range of someone at its center. The blur is
+#  done with FFTs, so a step costs the same however many people are infected
+#  or how close together they are: linear in the number of people, plus the
+#  FFT of the grid. The grid only covers the targets and the cells in reach of
+#  them, so a tile or strip of a bigger map only pays for its own part of it.
+# The answer is only approximate, since everyone is treated as if they were at
+#  the center of their cell and the infected people as if they were spread
+#  evenly over theirs. The counts come back as floats. Finer cells are more
+#  accurate, but the grid grows with the square of `resolution`. Run
+#  `python calibration.py` to compare epidemics against the exact backends.
+class DensityBackend(ContactBackend):
+
+    name: str = 'density'
+
+    # `resolution` is the number of cells across the infection distance
+    def __init__(self, map_size: np.float64, resolution: float = 2.0) -> None:
+        self.map_size: np.float64 = map_size
+        self.resolution: float = resolution
+        # The transformed disk only changes if the grid does, so keep one
+        #  around for each size of grid it was made for
+        self.kernel_ffts: Dict[Tuple, np.ndarray] = {}
+
+    def options(self) -> Dict[str, Any]:
+        return {'map_size': float(self.map_size), 'resolution': self.resolution}
+
+    # The fraction of each cell near the center one that lies within `radius`
+    #  of the middle of the center cell, in units of cells
+    # Each cell is sampled on a fine subgrid, which is plenty accurate since
+    #  the kernel only gets computed once
+    @staticmethod
+    def kernel(radius: float, samples: int = 16) -> np.ndarray:
+        reach: int = int(np.ceil(radius + 0.5))
+        offsets: np.ndarray = (np.arange(samples) + 0.5) / samples - 0.5
+        # Every sample point in every cell along one axis
+        points: np.ndarray = \
+            (np.arange(-reach, reach+1)[:,None] + offsets[None,:]).reshape(-1)
+        inside: np.ndarray = points[:,None]**2 + points[None,:]**2 <= radius * radius
+        side: int = 2 * reach + 1
+        return inside.reshape((side, samples, side, samples)).mean(axis=(1,3))
+
+    def counts(
+      self,
+      sources: np.ndarray,
+      targets: np.ndarray,
+      infection_distance: np.float64,
+    ) -> np.ndarray:
+        if infection_distance <= 0:
+            return np.zeros(shape=(len(targets),), dtype=np.float64)
+        cell: float = float(infection_distance) / self.resolution
+        side: int = max(1, int(np.ceil(self.map_size / cell)))
+        def cells(positions: np.ndarray) -> np.ndarray:
+            return np.clip((positions / cell).astype(np.intp), 0, side - 1)
+        source_cells: np.ndarray = cells(sources)
+        target_cells: np.ndarray = cells(targets)
+
+        # Only the cells around the targets need a grid, which is much less
+        #  than the whole map when the targets are one tile or strip of it.
+        #  Sources further than the kernel reaches from every target can't be
+        #  counted by any of them.
+        reach: int = int(np.ceil(self.resolution + 0.5))
+        low: np.ndarray = np.maximum(target_cells.min(axis=0) - reach, 0)
+        high: np.ndarray = np.minimum(target_cells.max(axis=0) + reach, side - 1)
+        size: Tuple[int, int] = tuple(int(n) for n in high - low + 1)
+        source_cells = \
+            source_cells[np.all((source_cells >= low) & (source_cells <= high), axis=1)] - low
+        target_cells = target_cells - low
+        if len(source_cells) == 0:
+            return np.zeros(shape=(len(targets),), dtype=np.float64)
+        density: np.ndarray = \
+            np.bincount(
+                source_cells[:,0] * size[1] + source_cells[:,1],
+                minlength=size[0]*size[1]).reshape(size)
+
+        # Pad the grid so the blur doesn't wrap around its edges
+        shape: Tuple[int, int] = tuple(fft_size(n + 2*reach) for n in size)
+        key: Tuple = (self.resolution, shape)
+        if key not in self.kernel_ffts:
+            self.kernel_ffts[key] = np.fft.rfft2(self.kernel(self.resolution), s=shape)
+        blurred: np.ndarray = \
+            np.fft.irfft2(np.fft.rfft2(density, s=shape) * self.kernel_ffts[key], s=shape)
+        # The kernel is centered `reach` cells in, so everything comes out
+        #  shifted by that much
+        expected: np.ndarray = blurred[reach:reach+size[0], reach:reach+size[1]]
+        # Round off the noise the FFT leaves behind, so that people nowhere near
+        #  anyone infected aren't counted as exposed
+        expected[expected < 1e-6] = 0
+        return expected[target_cells[:,0], target_cells[:,1]]
+
+
+# The smallest size at least `n` with no prime factors above 5, which the FFT
+#  handles quickly
+def fft_size(n: int) -> int:
+    size: int = n
+    while True:
+        m: int = size
+        for p in [2, 3, 5]:
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return size
+        size += 1
+
+
+# Rolls for which of some exposed people get infected, given how many infected
+#  people each of them is near
+# Each of them gets one roll for every infected person, and is infected if any
+#  of them come up. Counts from approximate backends are only the expected
+#  number of infected people nearby. The actual number is taken to be Poisson
+#  around that, which is what it would be if people were scattered at random,
+#  and so the chance that no roll comes up is exp(-p_infect * count).
+def roll_infections(
+  rng: np.random.Generator,
+  counts: np.ndarray,
+  p_infect: float,
+) -> np.ndarray:
+    if counts.dtype.kind == 'f':
+        return rng.random(len(counts)) < -np.expm1(-p_infect * counts)
+    return rng.binomial(counts, p_infect) > 0
+
+
+# Re-picks one of the other backends every tick
+# Which one is fastest depends on how dense the map is and on what fraction of
+#  the population is infected, and both of those swing wildly over the course
+#  of an epidemic. We estimate the cost of each backend from those two numbers
+#  and go with the cheapest.
+class AutoBackend(ContactBackend):
+
+    name: str = 'auto'
+
+    def __init__(self, map_size: np.float64) -> None:
+        self.map_size: np.float64 = map_size
+        self.backends: List[ContactBackend] = [DenseBackend(), GridBackend()]
+        if has_scipy():
+            self.backends.append(TreeBackend())
+        # Keep track of what we used last, mostly for debugging
+        self.chosen: ContactBackend = self.backends[0]
+
+    def options(self) -> Dict[str, Any]:
+        return {'map_size': float(self.map_size)}
+
+    # Rough cost of each backend, in units of one pair distance test
+    # The constants come from timing the backends against each other
+    def costs(
+      self,
+      pop_size: int,
+      infected_fraction: float,
+      healthy_fraction: float,
+      infection_distance: np.float64,
+    ) -> Dict[str, float]:
+        density: float = pop_size / self.map_size**2
+        num_infected: float = infected_fraction * pop_size
+        num_healthy: float = healthy_fraction * pop_size
+        # Number of infected-healthy pairs that are actually in range
+        close_pairs: float = \
+            num_infected * num_healthy / pop_size \
+            * density * np.pi * infection_distance**2
+        return {
+            'dense': num_infected * num_healthy,
+            'grid': 12 * (num_infected + num_healthy) + 20 * close_pairs,
+            'tree': 60 * (num_infected + num_healthy) + 11 * close_pairs,
+        }
+
+    # We need the size of the whole population to estimate the density, so
+    #  pick the backend before the base class cuts everyone else out
+    def people_transmitting(
+      self,
+      positions: np.ndarray,
+      infected: np.ndarray,
+      healthy: np.ndarray,
+      infection_distance: np.float64,
+    ) -> np.ndarray:
+        pop_size: int = len(positions)
+        if pop_size == 0:
+            return np.zeros(shape=(0,), dtype=np.int64)
+        costs: Dict[str, float] = \
+            self.costs(
+                pop_size,
+                np.count_nonzero(infected) / pop_size,
+                np.count_nonzero(healthy) / pop_size,
+                infection_distance)
+        self.chosen = min(self.backends, key=lambda b: costs[b.name])
+        return super().people_transmitting(positions, infected, healthy, infection_distance)
+
+    def counts(
+      self,
+      sources: np.ndarray,
+      targets: np.ndarray,
+      infection_distance: np.float64,
+    ) -> np.ndarray:
+        return self.chosen.counts(sources, targets, infection_distance)
+
+
+# Creates the contact backend with the given name, and the options from some
+#  backend's `options` if there are any
+# A backend that's already been created is passed straight through, so that
+#  backends with options can be used too
+def make_backend(
+  name: Union[str, ContactBackend],
+  map_size: np.float64,
+  options: Optional[Dict[str, Any]] = None,
+) -> ContactBackend:
+    if isinstance(name, ContactBackend):
+        return name
+    backends: Dict[str, type] = {
+        'dense': DenseBackend,
+        'grid': GridBackend,
+        'tree': TreeBackend,
+        'density': DensityBackend,
+        'auto': AutoBackend,
+    }
+    if name not in backends:
+        raise ValueError(f"Unknown contact backend: {name}")
+    options = dict(options) if options is not None else {}
+    # These ones need to know how big the map is
+    if name in ['density', 'auto']:
+        options.setdefault('map_size', map_size)
+    return backends[name](**options)
+
+
+# Cross-check all the backends against each other on a random population, and
+#  time them while we're at it
+if __name__ == '__main__':
+    import timeit
+    for pop_size in [300, 3000, 30000]:
+        positions: np.ndarray = np.random.uniform(0.0, 100.0, size=(pop_size,2))
+        infected: np.ndarray = np.random.uniform(size=(pop_size,)) < 0.1
+        healthy: np.ndarray = ~infected
+        reference: np.ndarray = None
+        for name in ['dense', 'grid', 'tree', 'auto']:
+            # The dense backend is too slow on big populations
+            if name == 'dense' and pop_size > 3000:
+                continue
+            backend: ContactBackend = make_backend(name, 100.0)
+            counts: np.ndarray = \
+                backend.people_transmitting(positions, infected, healthy, 2.0)
+            if reference is None:
+                reference = counts
+            assert np.array_equal(counts, reference), name
+            print(pop_size, name, timeit.timeit(
+                lambda: backend.people_transmitting(positions, infected, healthy, 2.0),
+                number=1))
@@ -0,0 +1,78 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Dict, Tuple
+
+# Needed for working with every replicate at once
+import numpy as np
+# Needed for fast neighbor search
+import contact
+# The model we're running lots of copies of
+from model import Model
+
+
+# Runs many independent replicates of the same epidemic at once
+# Everyone's state gets an extra leading axis for the replicate, so `positions`
+#  is (replicates, pop_size, 2) and `healths` and `infection_end` are
+#  (replicates, pop_size). Moving and updating health work on arrays of any
+#  shape, so they advance all the replicates together as batched array
+#  operations. The contact step does one grid search over every replicate,
+#  with each replicate in its own group.
+# The statistics come back out as (replicates, time) arrays.
+class Ensemble(Model):
+
+    # Takes the same arguments as `Model`, along with the number of
+    #  replicates to run
+    # Note that the contact backend isn't used, since every replicate has to
+    #  go through the grid at the same time
+    def __init__(self, replicates: int = 100, **kwargs) -> None:
+        self.replicates: int = replicates
+        super().__init__(**kwargs)
+
+    def population_shape(self) -> Tuple[int, ...]:
+        return (self.replicates, self.pop_size)
+
+
+    # Returns an array of size (self.replicates, self.pop_size) containing at
+    #  index (r,i) the number of infected people in replicate r that person i
+    #  is within self.infection_distance of
+    def people_transmitting(self) -> np.ndarray:
+        infected: np.ndarray = self.healths == Model.INFECTED
+        healthy: np.ndarray = self.healths == Model.HEALTHY
+        # Which replicate everyone is in
+        replicate: np.ndarray = \
+            np.broadcast_to(
+                np.arange(self.replicates).reshape((self.replicates,1)),
+                self.population_shape())
+        counts: np.ndarray = np.zeros(shape=self.population_shape(), dtype=np.int64)
+        counts[healthy] = \
+            contact.grid_counts(
+                self.positions[infected],
+                self.positions[healthy],
+                self.infection_distance,
+                source_groups=replicate[infected],
+                target_groups=replicate[healthy])
+        return counts
+
+
+    # The state also needs the number of replicates, to recreate the ensemble
+    #  with the right shape
+    def state(self) -> Dict[str, np.ndarray]:
+        return {**super().state(), 'replicates': np.array(self.replicates)}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray], **kwargs) -> Ensemble:
+        return super().from_state(state, replicates=int(state['replicates']), **kwargs)
+
+
+
+# Run a batch of replicates and print confidence bands on the final outcome
+if __name__ == '__main__':
+    ensemble = Ensemble(replicates=100, pop_size=1000)
+    ensemble.run(200)
+    for name, series in [
+        ('Peak infected', ensemble.infected.max(axis=1)),
+        ('Recovered', ensemble.recovered[:,-1]),
+        ('Dead', ensemble.dead[:,-1]),
+    ]:
+        low, mid, high = np.percentile(series, [5, 50, 95])
+        print(f"{name}: {mid} (90% band {low} to {high})")
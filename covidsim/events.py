@@ -0,0 +1,275 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import List, Optional, Tuple
+
+# Needed for finding the files
+import glob
+import os
+
+# Needed for the records and the `.npy` files
+import numpy as np
+# Needed for finding who could have infected who
+import contact
+# The model we're logging
+from model import Model
+
+
+# Keeps a log of every infection as a model runs, for contact tracing
+# The model itself only remembers that someone is infected, not who infected
+#  them. Attaching a log to a model records, for each new infection, when and
+#  where it happened, along with every infected person who was in range at the
+#  time. Any of them could have been the one, since everyone in range gets a
+#  roll. People who were already infected when the log was attached are
+#  recorded then, with nobody in range.
+# People are recorded by who they are rather than where they are in the
+#  arrays, which only differ with active set compaction.
+# Records go into preallocated chunks. Full chunks are written out all at once
+#  to `.npy` files in a directory, or just kept if there isn't one, so logging
+#  only costs a copy into the chunk and a neighbor search over the new
+#  infections every step.
+
+
+# One record for every infection
+# `candidates` is how many infected people were in range
+INFECTION: np.dtype = np.dtype([
+    ('time', np.int64),
+    ('infectee', np.int64),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('candidates', np.int32),
+])
+# One record for every infected person in range of every new infection
+CANDIDATE: np.dtype = np.dtype([
+    ('time', np.int64),
+    ('infectee', np.int64),
+    ('infector', np.int64),
+])
+
+
+# Appends records to preallocated chunks
+# Full chunks are saved as `{name}-{n}.npy` in the directory, if there is one
+class RecordBuffer:
+
+    def __init__(
+      self,
+      dtype: np.dtype,
+      chunk: int = 2**16,
+      directory: Optional[str] = None,
+      name: str = '',
+    ) -> None:
+        self.buffer: np.ndarray = np.empty(chunk, dtype=dtype)
+        self.filled: int = 0
+        self.directory: Optional[str] = directory
+        self.name: str = name
+        # The chunks that have been filled, if they're not being saved
+        self.chunks: List[np.ndarray] = []
+        self.saved: int = 0
+
+    def __len__(self) -> int:
+        return sum(len(c) for c in self.chunks) + self.saved_records() + self.filled
+
+    # Appends records given as one array per field, all the same length
+    def append(self, **fields: np.ndarray) -> None:
+        n: int = len(next(iter(fields.values())))
+        done: int = 0
+        while done < n:
+            take: int = min(n - done, len(self.buffer) - self.filled)
+            rows: np.ndarray = self.buffer[self.filled:self.filled+take]
+            for name, values in fields.items():
+                rows[name] = values[done:done+take]
+            self.filled += take
+            done += take
+            if self.filled == len(self.buffer):
+                self.flush()
+
+    # Moves whatever has been appended out of the chunk
+    def flush(self) -> None:
+        if self.filled == 0:
+            return
+        records: np.ndarray = self.buffer[:self.filled]
+        if self.directory is None:
+            self.chunks.append(records.copy())
+        else:
+            np.save(self.path(self.saved), records)
+            self.saved += 1
+        self.filled = 0
+
+    def path(self, n: int) -> str:
+        return os.path.join(self.directory, f'{self.name}-{n:06d}.npy')
+
+    def saved_records(self) -> int:
+        return sum(len(np.load(self.path(n), mmap_mode='r')) for n in range(self.saved))
+
+    # Every record so far, in order
+    def records(self) -> np.ndarray:
+        saved: List[np.ndarray] = [np.load(self.path(n)) for n in range(self.saved)]
+        return np.concatenate(saved + self.chunks + [self.buffer[:self.filled]])
+
+
+class EventLog:
+
+    # Starts logging a model's infections
+    # Finding everyone in range of each infection can be turned off with
+    #  `candidates`, which leaves just the infections
+    def __init__(
+      self,
+      model: Model,
+      directory: Optional[str] = None,
+      chunk: int = 2**16,
+      candidates: bool = True,
+    ) -> None:
+        self.model: Model = model
+        self.directory: Optional[str] = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.infections: RecordBuffer = RecordBuffer(INFECTION, chunk, directory, 'infections')
+        self.candidates: Optional[RecordBuffer] = \
+            RecordBuffer(CANDIDATE, chunk, directory, 'candidates') if candidates else None
+        # Everyone who's infected already
+        seeds: np.ndarray = np.flatnonzero(model.healths.reshape(-1) == Model.INFECTED)
+        self.record(seeds, np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+        # Find out about every new infection from here on
+        newly_infected = model.newly_infected
+        def logged() -> np.ndarray:
+            infected: np.ndarray = newly_infected()
+            self.log(infected)
+            return infected
+        model.newly_infected = logged
+
+    # Stops logging, and writes out everything that's left
+    def close(self) -> None:
+        if 'newly_infected' in vars(self.model):
+            del self.model.newly_infected
+        self.flush()
+
+    def flush(self) -> None:
+        self.infections.flush()
+        if self.candidates is not None:
+            self.candidates.flush()
+
+    def __enter__(self) -> EventLog:
+        return self
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+    # Records the people who got infected this timestep
+    # This runs before their health changes, so everyone still infected is
+    #  someone who could have infected them. Some models mark them as infected
+    #  early, so they're left out of that.
+    def log(self, infected: np.ndarray) -> None:
+        if len(infected) == 0 or self.candidates is None:
+            self.record(infected, np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+            return
+        model: Model = self.model
+        healths: np.ndarray = model.healths.reshape(-1)[:model.active]
+        is_source: np.ndarray = healths == Model.INFECTED
+        is_source[infected] = False
+        sources: np.ndarray = np.flatnonzero(is_source)
+        positions: np.ndarray = model.positions.reshape((-1, 2))
+        # Usually there are far fewer new infections than infected people, so
+        #  first mark every cell of the map that has a new infection in or
+        #  next to it, and skip the infected people who aren't in one of those
+        #  before searching properly
+        cell: float = model.infection_distance * (1 + 1e-6) if model.infection_distance > 0 else 1.0
+        side: int = int(model.map_size / cell) + 1
+        def cells(people: np.ndarray) -> np.ndarray:
+            return np.clip((positions[people] / cell).astype(np.intp), 0, side - 1) + 1
+        near: np.ndarray = np.zeros(shape=(side + 2, side + 2), dtype=bool)
+        around: np.ndarray = cells(infected)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                near[around[:,0] + dx, around[:,1] + dy] = True
+        here: np.ndarray = cells(sources)
+        sources = sources[near[here[:,0], here[:,1]]]
+        # People in different populations can't infect each other
+        grouped: bool = model.num_people() > model.pop_size
+        source_idx, target_idx = \
+            contact.grid_pairs(
+                positions[sources],
+                positions[infected],
+                model.infection_distance,
+                source_groups=sources // model.pop_size if grouped else None,
+                target_groups=infected // model.pop_size if grouped else None)
+        self.record(infected, sources[source_idx], target_idx)
+
+    # Records some infections, along with the pairs of (infector, index into
+    #  `infected`) that were in range
+    def record(self, infected: np.ndarray, infectors: np.ndarray, which: np.ndarray) -> None:
+        model: Model = self.model
+        ids: np.ndarray = model.person_ids(infected)
+        positions: np.ndarray = model.positions.reshape((-1, 2))[infected]
+        self.infections.append(
+            time=np.full(len(infected), model.time),
+            infectee=ids,
+            x=positions[:,0],
+            y=positions[:,1],
+            candidates=np.bincount(which, minlength=len(infected)))
+        if self.candidates is not None and len(which) > 0:
+            self.candidates.append(
+                time=np.full(len(which), model.time),
+                infectee=ids[which],
+                infector=model.person_ids(infectors))
+
+    # Everything logged so far
+    def read(self) -> Tuple[np.ndarray, np.ndarray]:
+        return \
+            self.infections.records(), \
+            self.candidates.records() if self.candidates is not None else np.empty(0, dtype=CANDIDATE)
+
+
+# Reads back a log written to a directory
+def read_log(directory: str) -> Tuple[np.ndarray, np.ndarray]:
+    def read(name: str, dtype: np.dtype) -> np.ndarray:
+        paths: List[str] = sorted(glob.glob(os.path.join(directory, f'{name}-*.npy')))
+        return np.concatenate([np.empty(0, dtype=dtype)] + [np.load(p) for p in paths])
+    return read('infections', INFECTION), read('candidates', CANDIDATE)
+
+
+# Works out how many people everyone infected
+# Each infection is split evenly between everyone who was in range at the
+#  time, since any of them could have been the one. Returns the people who
+#  were infected, and how many people each of them infected in turn.
+# People infected near the end of the log haven't finished infecting others
+#  yet, so their counts are too low.
+def secondary_cases(infections: np.ndarray, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    people: np.ndarray = infections['infectee']
+    # Everyone only gets infected once, so sorting lines up the infections
+    #  with the candidates
+    order: np.ndarray = np.argsort(people)
+    def rows(ids: np.ndarray) -> np.ndarray:
+        return order[np.searchsorted(people[order], ids)]
+    # How much of each infection each candidate gets
+    share: np.ndarray = 1 / infections['candidates'][rows(candidates['infectee'])]
+    return people, np.bincount(rows(candidates['infector']), weights=share, minlength=len(people))
+
+# The reproduction number over time
+# This is the average number of people infected by someone infected on each
+#  timestep, from `times[0]` to `times[-1]`
+def reproduction_numbers(infections: np.ndarray, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    _, cases = secondary_cases(infections, candidates)
+    if len(cases) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    first: int = int(infections['time'].min())
+    offsets: np.ndarray = infections['time'] - first
+    infected: np.ndarray = np.bincount(offsets)
+    caused: np.ndarray = np.bincount(offsets, weights=cases)
+    times: np.ndarray = np.arange(first, first + len(infected))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return times, caused / infected
+
+
+
+# Run an epidemic with a log, and print the reproduction number over time
+if __name__ == '__main__':
+    import time
+    seed: int = np.random.SeedSequence().entropy
+    print(f"Seed: {seed}")
+    model = Model(pop_size=20000, map_size=200.0, initial_cases=5, seed=seed)
+    started: float = time.perf_counter()
+    with EventLog(model) as log:
+        model.run(150)
+    print(f"Ran in {time.perf_counter() - started:.2f} s")
+    times, r = reproduction_numbers(*log.read())
+    for t, value in zip(times[::10], r[::10]):
+        print(f"{t}: R = {value:.2f}")
@@ -0,0 +1,151 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import List, Tuple
+
+# Needed for running in parallel and writing files
+import argparse
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import tempfile
+
+# Everything here is drawn off-screen
+# This has to be picked before anything imports pyplot
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.image as image
+
+# Needed for working with the model's arrays
+import numpy as np
+# The thing we're simulating
+from model import Model, Snapshot
+# Needed for saving the model along with the recording
+from checkpoint import save_checkpoint, load_checkpoint
+# The viewer, which draws every frame
+from simulation import Simulation
+
+
+# Renders a run of the model to a video, without ever opening a window
+# The model is run headless first, recording everyone's position and health to
+#  arrays on disk. The frames are then drawn by a pool of processes, each
+#  taking its own chunk of the recording with its own off-screen viewer. Within
+#  a chunk, frames are blitted over the saved backgrounds just like in the
+#  window, so most frames only redraw the people and the statistics.
+# A recording directory holds
+#   `model.npz`: a checkpoint of the model at the end of the run, which has the
+#     parameters and all the statistics
+#   `times.npy`: the time of each recorded frame
+#   `positions.npy`, `healths.npy`: everyone's position and health in each frame
+
+
+# Runs a model for some number of timesteps, recording every so often
+# The first frame is the model as it was before running
+def record(model: Model, n_ticks: int, out_dir: str, every: int = 1) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    times: np.ndarray = np.arange(model.time, model.time + n_ticks + 1, every)
+    positions: np.ndarray = \
+        np.lib.format.open_memmap(
+            os.path.join(out_dir, 'positions.npy'),
+            mode='w+',
+            dtype=np.float32,
+            shape=(len(times),) + model.positions.shape)
+    healths: np.ndarray = \
+        np.lib.format.open_memmap(
+            os.path.join(out_dir, 'healths.npy'),
+            mode='w+',
+            dtype=Model.Health,
+            shape=(len(times),) + model.healths.shape)
+    positions[0] = model.positions
+    healths[0] = model.healths
+    for frame, snapshot in enumerate(model.iter_ticks(n_ticks, every), 1):
+        positions[frame] = snapshot.positions
+        healths[frame] = snapshot.healths
+    positions.flush()
+    healths.flush()
+    np.save(os.path.join(out_dir, 'times.npy'), times)
+    save_checkpoint(model, os.path.join(out_dir, 'model.npz'))
+
+# Where a given frame goes
+def frame_path(frames_dir: str, frame: int) -> str:
+    return os.path.join(frames_dir, f'frame-{frame:06d}.png')
+
+
+# Draws some range of frames from a recording to PNG files
+# This is what gets sent to the worker processes, so it has to be at the top
+#  level of the module
+def render_frames(recording: str, frames_dir: str, start: int, stop: int) -> int:
+    model: Model = load_checkpoint(os.path.join(recording, 'model.npz'))
+    times: np.ndarray = np.load(os.path.join(recording, 'times.npy'))
+    positions: np.ndarray = np.load(os.path.join(recording, 'positions.npy'), mmap_mode='r')
+    healths: np.ndarray = np.load(os.path.join(recording, 'healths.npy'), mmap_mode='r')
+    sim: Simulation = Simulation(model=model, interactive=False)
+    for frame in range(start, stop):
+        sim.show(Snapshot(int(times[frame]), positions[frame], healths[frame]))
+        # The frames are only going to be read back once by the encoder, so
+        #  don't spend long compressing them
+        image.imsave(
+            frame_path(frames_dir, frame),
+            np.asarray(sim.fig.canvas.buffer_rgba()),
+            pil_kwargs={'compress_level': 1})
+    return stop - start
+
+# Draws every frame of a recording, spread over a pool of processes
+def render(recording: str, frames_dir: str, workers: int = None, chunk: int = 50) -> None:
+    os.makedirs(frames_dir, exist_ok=True)
+    n_frames: int = len(np.load(os.path.join(recording, 'times.npy')))
+    chunks: List[Tuple[int, int]] = \
+        [(start, min(start + chunk, n_frames)) for start in range(0, n_frames, chunk)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(render_frames, recording, frames_dir, start, stop)
+            for start, stop in chunks
+        ]
+        done: int = 0
+        for future in concurrent.futures.as_completed(futures):
+            done += future.result()
+            print(f"Rendered {done}/{n_frames} frames")
+
+# Stitches rendered frames together into a video
+# This needs `ffmpeg`
+def encode(frames_dir: str, path: str, fps: int = 30) -> None:
+    ffmpeg: str = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("Encoding video needs ffmpeg, which wasn't found")
+    subprocess.run([
+        ffmpeg, '-y', '-loglevel', 'error',
+        '-framerate', str(fps),
+        '-i', os.path.join(frames_dir, 'frame-%06d.png'),
+        '-pix_fmt', 'yuv420p',
+        path,
+    ], check=True)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render a run of the simulation to a video')
+    parser.add_argument('out', help='Video to write, or a directory to put PNG frames in')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--ticks', type=int, default=500, help='Timesteps to run for')
+    parser.add_argument('--every', type=int, default=1, help='Timesteps between frames')
+    parser.add_argument('--fps', type=int, default=30, help='Frames per second of video')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes to use')
+    parser.add_argument('--pop-size', type=int, default=5000)
+    args = parser.parse_args()
+    video: bool = os.path.splitext(args.out)[1] != ''
+    # Don't make someone wait for all the frames just to find this out
+    if video and shutil.which('ffmpeg') is None:
+        parser.error("writing video needs ffmpeg, which wasn't found")
+
+    seed: int = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+    print(f"Seed: {seed}")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        recording: str = os.path.join(scratch, 'recording')
+        record(Model(pop_size=args.pop_size, seed=seed), args.ticks, recording, args.every)
+        if not video:
+            render(recording, args.out, args.workers)
+        else:
+            frames_dir: str = os.path.join(scratch, 'frames')
+            render(recording, frames_dir, args.workers)
+            encode(frames_dir, args.out, args.fps)
@@ -0,0 +1,190 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Union
+
+# Needed for stepping the regions at the same time
+import concurrent.futures
+
+# Needed for the travel matrix and picking who travels
+import numpy as np
+# The model each region runs
+from model import Model
+
+
+# Runs lots of separate regions, with a few people traveling between them
+# Each region is a `Model` of its own, with its own map, population and random
+#  stream, so the contact step only ever looks inside one region at a time.
+#  That makes the total cost the sum of lots of small contact steps, rather than
+#  one huge one. Regions don't affect each other within a step, so they can be
+#  stepped on a pool of threads.
+# After every step, some people travel. The travel matrix gives, at (i,j), the
+#  expected number of trips from region i to region j per timestep. It's
+#  usually sparse, and can be anything with a `tocoo` method, like a SciPy
+#  sparse matrix, or just a dense array. The number of trips along each route
+#  is Poisson around that.
+# Regions never change size, so every trip is a swap: someone in region i and
+#  someone in region j trade places, taking their health and the rest of their
+#  infection with them. Each ends up wherever the other was standing. The dead
+#  don't travel.
+# Since every trip from i to j is also one from j to i, a trip at (i,j) is the
+#  same as one at (j,i). Only the total along each pair of regions matters, so
+#  a matrix that isn't symmetric behaves the same as one with both directions set
+#  to the average of the two.
+# Stepping on threads needs the pool shut down afterwards, with `close()`, or
+#  by using the metapopulation as a context manager.
+class Metapopulation:
+
+    # Each region is either a `Model` or the arguments to create one with
+    # Regions that get created here have their seeds spawned from `seed`
+    def __init__(
+      self,
+      regions: List[Union[Model, Dict[str, Any]]],
+      travel: Any,
+      seed: Union[int, np.random.SeedSequence, None] = None,
+      threads: int = 1,
+    ) -> None:
+        seeds: List[np.random.SeedSequence] = \
+            np.random.SeedSequence(seed).spawn(len(regions) + 1)
+        self.regions: List[Model] = [
+            region if isinstance(region, Model) else Model(**region, seed=seeds[r])
+            for r, region in enumerate(regions)
+        ]
+        for region in self.regions:
+            if region.active_set or region.num_people() != region.pop_size:
+                raise ValueError("Regions have to be plain models with one population each")
+            # Travelers keep their infections, which have to fit in the
+            #  schedule of wherever they end up
+            if region.time != self.regions[0].time or \
+              region.infection_time != self.regions[0].infection_time:
+                raise ValueError("All the regions have to be at the same time, with the same infection time")
+        # The routes with any travel along them
+        if not hasattr(travel, 'tocoo'):
+            travel = np.asarray(travel, dtype=np.float64)
+            if travel.shape != (len(regions), len(regions)):
+                raise ValueError(f"The travel matrix has to be {len(regions)}x{len(regions)}, not {travel.shape}")
+            routes: np.ndarray = np.nonzero(travel)
+            self.origins: np.ndarray = routes[0]
+            self.destinations: np.ndarray = routes[1]
+            self.trips: np.ndarray = travel[routes]
+        else:
+            travel = travel.tocoo()
+            self.origins = np.asarray(travel.row)
+            self.destinations = np.asarray(travel.col)
+            self.trips = np.asarray(travel.data, dtype=np.float64)
+        # The randomness for who travels comes from its own stream
+        self.rng: np.random.Generator = np.random.default_rng(seeds[-1])
+        self.pool: Optional[concurrent.futures.ThreadPoolExecutor] = \
+            concurrent.futures.ThreadPoolExecutor(threads) if threads > 1 else None
+
+    # Shuts down the threads, if there are any
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self) -> Metapopulation:
+        return self
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @property
+    def time(self) -> int:
+        return self.regions[0].time
+
+    @property
+    def pop_size(self) -> int:
+        return sum(region.pop_size for region in self.regions)
+
+
+    # Swaps some people between two regions
+    def swap(self, i: int, j: int, trips: int) -> None:
+        here: Model = self.regions[i]
+        there: Model = self.regions[j]
+        movers: List[np.ndarray] = \
+            [np.flatnonzero(region.healths != Model.DECEASED) for region in [here, there]]
+        trips = min(trips, len(movers[0]), len(movers[1]))
+        if trips == 0:
+            return
+        movers = [self.rng.choice(alive, size=trips, replace=False) for alive in movers]
+        # Take everyone infected off their old region's schedule, remembering
+        #  when their infections end
+        healths: List[np.ndarray] = []
+        ends: List[np.ndarray] = []
+        for region, people in zip([here, there], movers):
+            healths.append(region.healths[people].copy())
+            infected: np.ndarray = people[healths[-1] == Model.INFECTED]
+            ends.append(region.infection_ends(people))
+            region.unschedule(infected)
+        # Then put them in their new region
+        for region, people, health, end in zip([there, here], movers[::-1], healths, ends):
+            region.healths[people] = health
+            sick: np.ndarray = health == Model.INFECTED
+            for t in np.unique(end[sick]):
+                region.schedule(people[sick & (end == t)], int(t))
+        # Anyone who's already been infected is an old case wherever they go
+        moved: int = \
+            int(np.count_nonzero(healths[0] >= Model.INFECTED)) - \
+            int(np.count_nonzero(healths[1] >= Model.INFECTED))
+        there.cases_moved_in += moved
+        here.cases_moved_in -= moved
+
+    def tick_travel(self) -> None:
+        trips: np.ndarray = self.rng.poisson(self.trips)
+        for i, j, n in zip(self.origins, self.destinations, trips):
+            if n > 0 and i != j:
+                self.swap(int(i), int(j), int(n))
+
+    # Advances every region by one timestep, then lets people travel
+    # Each region's statistics are recorded before anyone travels, so
+    #  travelers only show up in their new region's counts on the next step.
+    #  Travelers who were already infected aren't counted as new cases there.
+    def step(self) -> None:
+        if self.pool is not None:
+            list(self.pool.map(Model.step, self.regions))
+        else:
+            for region in self.regions:
+                region.step()
+        self.tick_travel()
+
+    def run(self, n_ticks: int) -> None:
+        for _ in range(n_ticks):
+            self.step()
+
+
+    # The statistics added up over every region, as (time,) arrays
+    # Each region's own are on the regions themselves
+    @property
+    def infected(self) -> np.ndarray:
+        return sum(region.infected for region in self.regions)
+    @property
+    def recovered(self) -> np.ndarray:
+        return sum(region.recovered for region in self.regions)
+    @property
+    def dead(self) -> np.ndarray:
+        return sum(region.dead for region in self.regions)
+    @property
+    def new_cases(self) -> np.ndarray:
+        return sum(region.new_cases for region in self.regions)
+
+
+
+# Run a chain of regions, with the epidemic starting at one end
+if __name__ == '__main__':
+    seed: int = np.random.SeedSequence().entropy
+    print(f"Seed: {seed}")
+    n_regions: int = 10
+    # Each region only has travel to the ones next to it
+    travel: np.ndarray = np.zeros(shape=(n_regions, n_regions))
+    for r in range(n_regions - 1):
+        travel[r, r+1] = 0.5
+    metapopulation = \
+        Metapopulation(
+            [{'pop_size': 2000, 'map_size': 60.0, 'initial_cases': 5 if r == 0 else 0}
+             for r in range(n_regions)],
+            travel,
+            seed=seed)
+    while metapopulation.time == 0 or metapopulation.infected[-1] > 0:
+        metapopulation.step()
+        if metapopulation.time % 10 == 0:
+            print(f"{metapopulation.time}: " + ' '.join(
+                f"{region.infected[-1]:5d}" for region in metapopulation.regions))
@@ -0,0 +1,633 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# Needed for saving the random number generator and the contact backend
+import json
+
+# Needed for efficient distance calculation
+import numpy as np
+# Needed for fast neighbor search
+import contact
+# Needed for keeping statistics
+from series import Series, write_table
+
+
+# Everyone's position and health at some point in time
+# These are either copies, or read-only views of the model's own arrays. Views
+#  cost nothing, but they change along with the model, so they're only good
+#  until it steps again. Call `copy` to keep one around for longer.
+# `ids` says who is at each place in the other arrays. Active set compaction
+#  moves people around, so following someone from one snapshot to the next
+#  takes their id rather than their index.
+# Fields that weren't asked for are `None`.
+class Snapshot:
+
+    __slots__ = ['time', 'positions', 'healths', 'ids']
+
+    # The fields that can be asked for
+    FIELDS: List[str] = ['positions', 'healths', 'ids']
+
+    def __init__(
+      self,
+      time: int,
+      positions: Optional[np.ndarray],
+      healths: Optional[np.ndarray],
+      ids: Optional[np.ndarray] = None,
+    ) -> None:
+        self.time: int = time
+        self.positions: Optional[np.ndarray] = positions
+        self.healths: Optional[np.ndarray] = healths
+        self.ids: Optional[np.ndarray] = ids
+
+    def copy(self) -> Snapshot:
+        return Snapshot(
+            self.time,
+            *[None if a is None else a.copy() for a in [self.positions, self.healths, self.ids]])
+
+
+# The model behind the simulation, without any of the plotting
+# Nothing in here touches matplotlib, so it can be advanced as fast as NumPy
+#  allows with `step` and `run`. The interactive viewer in `simulation.py` is
+#  just a front-end over this.
+class Model:
+
+    # Define constants to keep track of people's health
+    # We can't use an enum for this since they can't efficiently be put into
+    #  numpy arrays
+    Health = np.ubyte
+    HEALTHY: Model.Health = 0
+    INFECTED: Model.Health = 1
+    RECOVERED: Model.Health = 2
+    DECEASED: Model.Health = 3
+
+    # The parameters that get saved along with the model's state
+    PARAMETERS: List[str] = [
+        'pop_size',
+        'hospital_beds_ratio',
+        'infection_distance',
+        'infection_time',
+        'p_infect',
+        'p_recover',
+        'map_size',
+        'p_movement',
+        'compact',
+        'active_set',
+    ]
+
+
+    def __init__(
+      self,
+      pop_size: int = 5000,
+      initial_cases: int = 1,
+      hospital_beds_ratio: float = .003,
+      infection_distance: np.float64 = 2.0,
+      infection_time: np.uint64 = 20,
+      p_infect: float = 0.3,
+      p_recover: float = 0.7,
+      map_size: np.float64 = 100.0,
+      contact_backend: Union[str, contact.ContactBackend] = 'auto',
+      p_movement: float = 1.0,
+      seed: Union[int, np.random.SeedSequence, None] = None,
+      compact: bool = False,
+      active_set: bool = False,
+    ) -> None:
+
+        # Simulation starts at time t=0
+        self.time: int = 0
+
+        # Keep track of the population size for this simulation
+        self.pop_size: int = pop_size
+        # Also the other parameters given
+        self.map_size: np.float64 = map_size
+        self.infection_distance: np.float64 = infection_distance
+        self.infection_time: np.uint64 = infection_time
+        self.p_infect: float = p_infect
+        self.p_recover: float = p_recover
+        self.p_die: float = 1 - p_recover
+        self.hospital_beds_ratio: float = hospital_beds_ratio
+        # How we figure out who's close enough to infect who
+        # Can be 'dense', 'grid', 'tree', 'auto' to re-pick every tick, the
+        #  approximate 'density', or a backend that's already been created with
+        #  some options
+        self.contact: contact.ContactBackend = \
+            contact.make_backend(contact_backend, map_size)
+        # Probability that someone moves on a given timestep
+        # Social distancing lowers this
+        self.p_movement: float = p_movement
+        # All the randomness in the model comes from here
+        # Anything `np.random.default_rng` takes works as a seed, and the same
+        #  seed always gives the same run
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        # Whether to store everyone in as little memory as possible, for very
+        #  large populations
+        # Positions are kept in single precision, and the timestep infections
+        #  end on is kept in 16 bits and wraps around
+        self.compact: bool = compact
+        if compact and infection_time > 2**16:
+            raise ValueError(f"Infections can last at most {2**16} timesteps in compact mode")
+        self.position_dtype: type = np.float32 if compact else np.float64
+
+        # Position and health of everyone in the population
+        self.init_population(initial_cases)
+        # Whether to keep the people who are still healthy or infected at the
+        #  front of the arrays
+        # Everyone behind `active` has recovered or died, so nothing about them
+        #  can change any more. Ticks only work on the people in front, and
+        #  get cheaper as the epidemic burns out. Recovered people stop moving
+        #  once they're moved to the back, since where they are doesn't matter.
+        # This only works for a single population kept in memory
+        self.active_set: bool = active_set
+        if active_set and len(self.population_shape()) > 1:
+            raise ValueError("Active set compaction only works for a single population")
+        # How many people are at the front, and how many of those have settled
+        #  since the last compaction
+        self.active: int = self.num_people()
+        self.settled: int = 0
+        # The counts of everyone's health behind the front
+        self.settled_counts: np.ndarray = np.zeros(4, dtype=np.int64)
+        # Who everyone is, since compaction moves people around in the arrays
+        # Without compaction, everyone is just where they are
+        self.ids: Optional[np.ndarray] = \
+            np.arange(self.num_people()) if active_set else None
+
+        # Scratch space for every timestep, allocated once up front so that
+        #  stepping doesn't allocate anything the size of the population
+        # Everyone is worked on in tiles of at most `tile_size` people, so
+        #  that's all the space we need
+        tile: int = min(self.tile_size(), self.num_people())
+        # The steps everyone takes
+        self.steps: np.ndarray = np.empty(shape=(tile, 2), dtype=self.position_dtype)
+        # The random rolls for whether everyone moves
+        self.rolls: np.ndarray = np.empty(shape=(tile,), dtype=self.position_dtype)
+        # Who stays still, and whether everyone has some health
+        self.still: np.ndarray = np.empty(shape=(tile,), dtype=bool)
+        self.is_dead: np.ndarray = np.empty(shape=(tile,), dtype=bool)
+        self.is_infected: np.ndarray = np.empty(shape=(tile,), dtype=bool)
+        self.is_healthy: np.ndarray = np.empty(shape=(tile,), dtype=bool)
+
+        # Keep track of the statistics too
+        self.init_stats()
+
+
+    # Shape of the arrays holding everyone's health
+    # Everything else in the model is written to work with any shape, so
+    #  subclasses can hold more than one population at once
+    def population_shape(self) -> Tuple[int, ...]:
+        return (self.pop_size,)
+
+    # How many people there are in total
+    def num_people(self) -> int:
+        return int(np.prod(self.population_shape()))
+
+    # How many people get worked on at once
+    # Everyone does, unless a subclass wants to keep less in memory at a time
+    def tile_size(self) -> int:
+        return self.num_people()
+
+    # The ranges of (flat) indices of the people in each tile
+    # Only the first so many people are included, if given
+    def tiles(self, num_people: Optional[int] = None) -> Iterator[slice]:
+        if num_people is None:
+            num_people = self.num_people()
+        tile_size: int = max(self.tile_size(), 1)
+        for start in range(0, num_people, tile_size):
+            yield slice(start, min(start + tile_size, num_people))
+
+    # Creates an uninitialized array for holding something about everyone
+    # Subclasses can override this to store the population somewhere else
+    def new_array(self, name: str, shape: Tuple[int, ...], dtype: type) -> np.ndarray:
+        return np.empty(shape=shape, dtype=dtype)
+
+    # Creates everyone, with the given number of initial cases in each
+    #  population
+    def init_population(self, initial_cases: int) -> None:
+        shape: Tuple[int, ...] = self.population_shape()
+        self.positions: np.ndarray = \
+            self.new_array('positions', shape + (2,), self.position_dtype)
+        self.healths: np.ndarray = self.new_array('healths', shape, Model.Health)
+        # The timestep on which everyone's infection ends, for the people who
+        #  are infected
+        self.infection_end: np.ndarray = \
+            self.new_array('infection_end', shape, np.uint16 if self.compact else np.int64)
+        flat_positions: np.ndarray = self.positions.reshape((-1, 2))
+        for tile in self.tiles():
+            flat_positions[tile] = self.random_positions(tile)
+        self.healths[...] = Model.HEALTHY
+        self.infection_end[...] = 0
+        self.init_schedule()
+        # The initial cases start out having been infected for a timestep
+        #  already
+        cases: np.ndarray = self.initial_cases(initial_cases)
+        np.put(self.healths, cases, Model.INFECTED)
+        self.schedule(cases, max(self.infection_time - 2, 0))
+
+    # Places everyone in a tile somewhere on the map
+    def random_positions(self, tile: slice) -> np.ndarray:
+        return \
+            self.rng.uniform(
+                low=0.0,
+                high=self.map_size,
+                size=(tile.stop - tile.start, 2),
+            )
+
+    # Picks the (flat) indices of the initial cases
+    # Note that we don't have to randomly draw from `self.healths`. The
+    #  positions are all generated in the same way, and they're all
+    #  indistinguishable from each other. So we just take the first few people
+    #  in each population.
+    def initial_cases(self, initial_cases: int) -> np.ndarray:
+        populations: int = int(np.prod(self.population_shape()[:-1]))
+        return (
+            self.pop_size * np.arange(populations).reshape((-1, 1)) \
+            + np.arange(min(initial_cases, self.pop_size))
+        ).ravel()
+
+    # Creates the empty schedule of when infections end
+    # It's a timing wheel with a bucket for each timestep an infection can
+    #  last. Bucket `t % infection_time` holds arrays of the (flat) indices of
+    #  everyone whose infection ends on timestep `t`. Infections never last
+    #  longer than that, so nobody can land in a bucket a whole turn of the
+    #  wheel early.
+    def init_schedule(self) -> None:
+        self.wheel: List[List[np.ndarray]] = [[] for _ in range(max(self.infection_time, 1))]
+
+    # Records that some people's infections end on a given timestep
+    def schedule(self, indices: np.ndarray, end: int) -> None:
+        if len(indices) == 0:
+            return
+        # The end timesteps wrap around if they don't fit
+        np.put(self.infection_end, indices, end % (np.iinfo(self.infection_end.dtype).max + 1))
+        self.wheel[end % len(self.wheel)].append(indices)
+
+    # Takes everyone whose infection ends on the current timestep off the
+    #  schedule, and returns their (flat) indices
+    def infections_ending(self) -> np.ndarray:
+        bucket: List[np.ndarray] = self.wheel[self.time % len(self.wheel)]
+        ending: np.ndarray = \
+            np.concatenate(bucket) if len(bucket) > 0 else np.empty(0, dtype=np.intp)
+        bucket.clear()
+        return ending
+
+    # Takes some infected people off the schedule, like when they leave the
+    #  model
+    # Only their own buckets get searched, so this is cheap for a few people
+    def unschedule(self, indices: np.ndarray) -> None:
+        ends: np.ndarray = self.infection_ends(indices)
+        for end in np.unique(ends):
+            bucket: List[np.ndarray] = self.wheel[int(end) % len(self.wheel)]
+            leaving: np.ndarray = indices[ends == end]
+            bucket[:] = [b[~np.isin(b, leaving)] for b in bucket]
+
+    # The timesteps on which some infected people's infections end
+    def infection_ends(self, indices: np.ndarray) -> np.ndarray:
+        ends: np.ndarray = self.infection_end.reshape(-1)[indices].astype(np.int64)
+        # If the end timesteps wrapped around, they're still never more than
+        #  an infection away
+        if self.compact:
+            ends = self.time + (ends - self.time) % 2**16
+        return ends
+
+    # Creates the empty statistics
+    # We keep a count of everyone's health at every timestep, along with the
+    #  number of new cases, in arrays that grow as the model runs
+    def init_stats(self) -> None:
+        lead: Tuple[int, ...] = self.population_shape()[:-1]
+        self.health_counts: Series = Series(row_shape=lead + (4,))
+        self.new_case_counts: Series = Series(row_shape=lead)
+        # People who had already been infected and were moved in from
+        #  somewhere else since the statistics were last recorded, less the
+        #  ones moved out. They change the number of cases here without being
+        #  new cases.
+        self.cases_moved_in: np.ndarray = np.zeros(shape=lead, dtype=np.int64)
+
+    # The statistics over time
+    # These are (time,) arrays, with an extra leading axis if the model holds
+    #  more than one population
+    def history(self, health: Model.Health) -> np.ndarray:
+        return np.moveaxis(self.health_counts.view[...,health], 0, -1)
+    @property
+    def infected(self) -> np.ndarray:
+        return self.history(Model.INFECTED)
+    @property
+    def recovered(self) -> np.ndarray:
+        return self.history(Model.RECOVERED)
+    @property
+    def dead(self) -> np.ndarray:
+        return self.history(Model.DECEASED)
+    @property
+    def new_cases(self) -> np.ndarray:
+        return np.moveaxis(self.new_case_counts.view, 0, -1)
+
+
+    # Makes everyone take a step in a random direction with a given mean of
+    #  step length
+    # Everything is done in place in the scratch arrays, a tile at a time
+    def tick_locations(self, step_mean: np.float64 = 2.0) -> None:
+        # Compute our step if we move
+        # Note the formula for the standard deviation. Distance travelled is
+        #  the square-root of the sum of the squares of two normal random
+        #  variables, giving a chi-squared distribution.
+        flat_positions: np.ndarray = self.positions.reshape((-1, 2))
+        flat_healths: np.ndarray = self.healths.reshape(-1)
+        for tile in self.tiles(self.active):
+            size: int = tile.stop - tile.start
+            positions: np.ndarray = flat_positions[tile]
+            steps: np.ndarray = self.steps[:size]
+            still: np.ndarray = self.still[:size]
+            self.rng.standard_normal(out=steps, dtype=steps.dtype)
+            steps *= np.sqrt(step_mean/2)
+            # We don't want to move everyone
+            # Dead people don't move
+            # For everyone else, we roll some probability of moving, and don't
+            #  move if they miss that roll
+            self.rng.random(out=self.rolls[:size], dtype=self.rolls.dtype)
+            np.greater_equal(self.rolls[:size], self.p_movement, out=still)
+            np.equal(flat_healths[tile], Model.DECEASED, out=self.is_dead[:size])
+            still |= self.is_dead[:size]
+            np.copyto(steps, 0, where=still[:,np.newaxis])
+            # Acutally update the positions
+            # Make sure we don't step outside the map boundary
+            positions += steps
+            np.clip(positions, 0.0, self.map_size, out=positions)
+
+
+    # Returns an array of size (self.active,) containing at index i the
+    #  number of infected people person i is within self.infection_distance of
+    # That's everyone, unless active set compaction is on
+    def people_transmitting(self) -> np.ndarray:
+        healths: np.ndarray = self.healths.reshape(-1)[:self.active]
+        is_infected: np.ndarray = self.is_infected[:self.active]
+        is_healthy: np.ndarray = self.is_healthy[:self.active]
+        np.equal(healths, Model.INFECTED, out=is_infected)
+        np.equal(healths, Model.HEALTHY, out=is_healthy)
+        return \
+            self.contact.people_transmitting(
+                self.positions.reshape((-1, 2))[:self.active],
+                is_infected,
+                is_healthy,
+                self.infection_distance)
+
+
+    # Returns the (flat) indices of the people who get infected this timestep
+    # Only roll for the people who are actually near someone infected
+    def newly_infected(self) -> np.ndarray:
+        transmitting: np.ndarray = self.people_transmitting().ravel()
+        exposed: np.ndarray = np.flatnonzero(transmitting)
+        return exposed[contact.roll_infections(self.rng, transmitting[exposed], self.p_infect)]
+
+    # Updates the health of the healthy people to infected if they are near
+    #  someone else who is infected. Also changes the people whose infection
+    #  has run its course to recovered or deceased.
+    def tick_healths(self) -> None:
+        # Compute who becomes infected at the current time
+        infected: np.ndarray = self.newly_infected()
+        np.put(self.healths, infected, Model.INFECTED)
+        # Their infection lasts `infection_time` timesteps, counting this one
+        self.schedule(infected, self.time + self.infection_time - 1)
+        # Figure out who lives and who dies, out of the people whose infection
+        #  ends now
+        # Recovery happens with probability `p_recover`
+        ending: np.ndarray = self.infections_ending()
+        recovered: np.ndarray = self.rng.binomial(1, self.p_recover, size=len(ending)) > 0
+        np.put(self.healths, ending[~recovered], Model.DECEASED)
+        np.put(self.healths, ending[recovered], Model.RECOVERED)
+        # Once enough people at the front have settled, move them to the back
+        self.settled += len(ending)
+        if self.active_set and 4 * self.settled > self.active:
+            self.compact_active()
+
+    # Moves everyone at the front who has recovered or died to the back
+    # Everyone keeps their order otherwise, and the schedule is updated to
+    #  where the infected people ended up
+    def compact_active(self) -> None:
+        active: int = self.active
+        settled: np.ndarray = self.healths[:active] > Model.INFECTED
+        order: np.ndarray = np.concatenate((np.flatnonzero(~settled), np.flatnonzero(settled)))
+        self.positions[:active] = self.positions[order]
+        self.healths[:active] = self.healths[order]
+        self.infection_end[:active] = self.infection_end[order]
+        self.ids[:active] = self.ids[order]
+        moved_to: np.ndarray = np.empty(active, dtype=np.intp)
+        moved_to[order] = np.arange(active)
+        self.wheel = [[moved_to[indices] for indices in bucket] for bucket in self.wheel]
+        self.active = active - int(np.count_nonzero(settled))
+        self.settled = 0
+        self.settled_counts += np.bincount(self.healths[self.active:active], minlength=4)
+
+
+    # Who the people at some (flat) indices are, which stays the same even
+    #  when compaction moves them
+    def person_ids(self, indices: np.ndarray) -> np.ndarray:
+        return self.ids[indices] if self.ids is not None else indices
+
+    # Counts how many people have each health
+    # If there's more than one population, each one gets its own counts
+    def count_healths(self) -> np.ndarray:
+        # Nobody behind the front changes, so only the front needs counting
+        if self.active_set:
+            return np.bincount(self.healths[:self.active], minlength=4) + self.settled_counts
+        # Count everyone's health in one pass
+        # Each population gets its own range of bins
+        lead: Tuple[int, ...] = self.healths.shape[:-1]
+        groups: int = int(np.prod(lead))
+        codes: np.ndarray = self.healths
+        if groups > 1:
+            codes = self.healths + 4 * np.arange(groups).reshape(lead + (1,))
+        return np.bincount(codes.ravel(), minlength=4*groups).reshape(lead + (4,))
+
+    # Records the statistics for the current time
+    def tick_stats(self) -> None:
+        self.time += 1
+        counts: np.ndarray = self.count_healths()
+        # New cases are the change in the number of people who have ever been
+        #  infected, other than from people moving in or out
+        total_cases: np.ndarray = counts[...,Model.INFECTED:].sum(axis=-1)
+        last_total_cases: np.ndarray = \
+            self.health_counts.view[-1,...,Model.INFECTED:].sum(axis=-1) \
+            if len(self.health_counts) > 0 else 0
+        self.health_counts.append(counts)
+        self.new_case_counts.append(total_cases - last_total_cases - self.cases_moved_in)
+        self.cases_moved_in[...] = 0
+
+    # The statistics as a table, with one row per timestep (and population),
+    #  for exporting
+    def stats_table(self) -> Dict[str, np.ndarray]:
+        counts: np.ndarray = self.health_counts.view
+        shape: Tuple[int, ...] = counts.shape[:-1]
+        columns: Dict[str, np.ndarray] = {
+            'time': np.broadcast_to(np.arange(1, len(counts)+1).reshape((-1,) + (1,)*(len(shape)-1)), shape),
+        }
+        if len(shape) > 1:
+            columns['replicate'] = np.broadcast_to(np.arange(shape[1]), shape)
+        columns['healthy'] = counts[...,Model.HEALTHY]
+        columns['infected'] = counts[...,Model.INFECTED]
+        columns['recovered'] = counts[...,Model.RECOVERED]
+        columns['dead'] = counts[...,Model.DECEASED]
+        columns['new_cases'] = self.new_case_counts.view
+        return {k: v.ravel() for k, v in columns.items()}
+
+    # Writes the statistics to a `.csv` or `.parquet` file
+    def export_stats(self, path: str) -> None:
+        write_table(path, self.stats_table())
+
+
+    # Everyone's position, health and id right now
+    # By default these are copies. Otherwise they're read-only views, which
+    #  are only good until the model steps again.
+    def snapshot(
+      self,
+      copy: bool = True,
+      fields: List[str] = Snapshot.FIELDS,
+    ) -> Snapshot:
+        def take(name: str) -> Optional[np.ndarray]:
+            if name not in fields:
+                return None
+            # Without compaction, everyone's id is just where they are
+            array: np.ndarray = \
+                np.broadcast_to(np.arange(self.healths.shape[-1]), self.healths.shape) \
+                if name == 'ids' and self.ids is None else getattr(self, name)
+            if copy:
+                return array.copy()
+            view: np.ndarray = array.view()
+            view.flags.writeable = False
+            return view
+        unknown: List[str] = [f for f in fields if f not in Snapshot.FIELDS]
+        if len(unknown) > 0:
+            raise ValueError(f"Unknown snapshot fields: {unknown}")
+        return Snapshot(self.time, *[take(name) for name in Snapshot.FIELDS])
+
+    # Everything needed to pick the model back up exactly where it left off,
+    #  as a dictionary of arrays that can go straight into `np.savez`
+    # All the arrays are copies, so the model can keep running while the state
+    #  is being written somewhere else
+    def state(self) -> Dict[str, np.ndarray]:
+        return {
+            # The parameters, for recreating the model
+            **{p: np.array(getattr(self, p)) for p in Model.PARAMETERS},
+            'contact_backend': np.array(self.contact.name),
+            'contact_options': np.array(json.dumps(self.contact.options())),
+            # Everyone's state
+            'time': np.array(self.time),
+            **self.population_state(),
+            # The statistics so far
+            **self.stats_state(),
+            # The random number generator, so the rest of the run is identical
+            'rng': np.array(json.dumps(self.rng.bit_generator.state)),
+        }
+
+    def population_state(self) -> Dict[str, np.ndarray]:
+        return {
+            'positions': self.positions.copy(),
+            'healths': self.healths.copy(),
+            'infection_end': self.infection_end.copy(),
+            'active': np.array(self.active),
+            **({'ids': self.ids.copy()} if self.ids is not None else {}),
+        }
+
+    def restore_population(self, state: Dict[str, np.ndarray]) -> None:
+        self.positions = np.array(state['positions'])
+        self.healths = np.array(state['healths'])
+        self.infection_end = np.array(state['infection_end'])
+        self.active = int(state['active'])
+        self.settled = int(np.count_nonzero(self.healths.reshape(-1)[:self.active] > Model.INFECTED))
+        self.settled_counts = np.bincount(self.healths.reshape(-1)[self.active:], minlength=4)
+        if 'ids' in state:
+            self.ids = np.array(state['ids'])
+
+    def stats_state(self) -> Dict[str, np.ndarray]:
+        return {
+            'health_counts': self.health_counts.view.copy(),
+            'new_cases': self.new_case_counts.view.copy(),
+            'cases_moved_in': self.cases_moved_in.copy(),
+        }
+
+    def restore_stats(self, state: Dict[str, np.ndarray]) -> None:
+        self.health_counts.assign(state['health_counts'])
+        self.new_case_counts.assign(state['new_cases'])
+        if 'cases_moved_in' in state:
+            self.cases_moved_in[...] = state['cases_moved_in']
+
+    # Puts everyone who's infected back on the schedule
+    # Everyone infected on the same timestep was scheduled in order of their
+    #  index, so this puts them back in the same order they were in before
+    def restore_schedule(self) -> None:
+        self.init_schedule()
+        flat_healths: np.ndarray = self.healths.reshape(-1)
+        infected: np.ndarray = \
+            np.concatenate([
+                tile.start + np.flatnonzero(flat_healths[tile] == Model.INFECTED)
+                for tile in self.tiles()
+            ])
+        ends: np.ndarray = self.infection_ends(infected)
+        for end in np.unique(ends):
+            self.schedule(infected[ends == end], int(end))
+
+    # Recreates a model from what `state` returned
+    # The contact backend is created again with the same options, unless a
+    #  different one is passed in
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray], **kwargs) -> Model:
+        if kwargs.get('contact_backend') is None:
+            kwargs['contact_backend'] = \
+                contact.make_backend(
+                    str(state['contact_backend']),
+                    state['map_size'].item(),
+                    json.loads(str(state['contact_options'])) if 'contact_options' in state else None)
+        model: Model = \
+            cls(
+                **{p: state[p].item() for p in cls.PARAMETERS},
+                **kwargs)
+        model.time = int(state['time'])
+        model.restore_population(state)
+        model.restore_schedule()
+        model.restore_stats(state)
+        model.rng.bit_generator.state = json.loads(str(state['rng']))
+        return model
+
+
+    # Advances the whole model by one timestep
+    def step(self) -> None:
+        self.tick_locations()
+        self.tick_healths()
+        self.tick_stats()
+
+    # Advances the model by a given number of timesteps
+    def run(self, n_ticks: int) -> None:
+        for _ in range(n_ticks):
+            self.step()
+
+    # Advances the model by a given number of timesteps, handing back a
+    #  snapshot every `every` of them
+    # Nothing runs until the next snapshot is asked for, so whatever's reading
+    #  them sets the pace, and they can be fed through a chain of generators
+    #  without ever holding more than one. The snapshots are views unless
+    #  `copy` is set, so each one is only good until the next is asked for.
+    # Any timesteps after the last snapshot are run when the generator is
+    #  asked for one more.
+    def iter_ticks(
+      self,
+      n_ticks: int,
+      every: int = 1,
+      fields: List[str] = Snapshot.FIELDS,
+      copy: bool = False,
+    ) -> Iterator[Snapshot]:
+        if every < 1:
+            raise ValueError(f"Snapshots have to be at least one timestep apart, not {every}")
+        for _ in range(n_ticks // every):
+            self.run(every)
+            yield self.snapshot(copy, fields)
+        self.run(n_ticks % every)
+
+
+
+# Run the model headless, and print the statistics as we go
+if __name__ == '__main__':
+    seed: int = np.random.SeedSequence().entropy
+    print(f"Seed: {seed}")
+    model = Model(seed=seed)
+    while True:
+        model.step()
+        print(f"{model.time}: {model.infected[-1]} infected, {model.recovered[-1]} recovered, {model.dead[-1]} dead")
+        if model.infected[-1] == 0:
+            break
@@ -0,0 +1,185 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Dict, Iterator, List, Tuple
+
+# Needed for finding the files
+import os
+
+# Needed for the memory-mapped arrays
+import numpy as np
+# Needed for rolling for infections
+import contact
+# The model we're storing on disk
+from model import Model
+# Needed for saving everything that isn't already on disk
+from checkpoint import write_state
+
+
+# Runs a population that's too big to fit in memory
+# Everyone's position, health and infection end time live in `.npy` files in a
+#  storage directory, which are memory-mapped. Every step goes through the
+#  population a tile at a time, so only a tile's worth of people and scratch
+#  space has to be in memory at once, along with the positions of everyone
+#  who's infected.
+# To keep the contact step cheap, people start out in horizontal bands of the
+#  map, one band per tile. Only infected people near a tile's bounding box are
+#  checked against it. People slowly drift out of their bands as they move,
+#  which makes that a bit less effective but never changes the result.
+# The files double as a checkpoint. Call `sync` between steps to write out
+#  everything else, then `OutOfCoreModel.open` picks the run back up from the
+#  directory. A crash in the middle of a step leaves the files half-updated,
+#  so they're only good as of the last `sync` if nothing has stepped since.
+class OutOfCoreModel(Model):
+
+    # Takes the same arguments as `Model`, along with the directory to keep
+    #  everything in and the number of people to work on at once
+    # Only one population is supported, so this doesn't mix with `Ensemble`
+    def __init__(
+      self,
+      storage: str,
+      tile_size: int = 2**20,
+      resume: bool = False,
+      **kwargs,
+    ) -> None:
+        self.storage: str = storage
+        self.people_per_tile: int = tile_size
+        # Whether to open the files that are already there rather than start
+        #  a new population
+        self.resume: bool = resume
+        os.makedirs(storage, exist_ok=True)
+        if kwargs.get('active_set', False):
+            raise ValueError(f"{type(self).__name__} doesn't support active set compaction")
+        super().__init__(**kwargs)
+
+    def tile_size(self) -> int:
+        return self.people_per_tile
+
+    def new_array(self, name: str, shape: Tuple[int, ...], dtype: type) -> np.ndarray:
+        path: str = os.path.join(self.storage, name + '.npy')
+        if not self.resume:
+            return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+        array: np.ndarray = np.load(path, mmap_mode='r+')
+        if array.shape != shape or array.dtype != dtype:
+            raise ValueError(f"{path} holds {array.dtype} {array.shape}, but {dtype.__name__} {shape} was expected")
+        return array
+
+    def init_population(self, initial_cases: int) -> None:
+        if not self.resume:
+            super().init_population(initial_cases)
+            return
+        # Everyone's already on disk, and the schedule gets rebuilt when the
+        #  rest of the state is restored
+        shape: Tuple[int, ...] = self.population_shape()
+        self.positions: np.ndarray = \
+            self.new_array('positions', shape + (2,), self.position_dtype)
+        self.healths: np.ndarray = self.new_array('healths', shape, Model.Health)
+        self.infection_end: np.ndarray = \
+            self.new_array('infection_end', shape, np.uint16 if self.compact else np.int64)
+        self.init_schedule()
+
+    # Each tile gets its own band of the map, with a height in proportion to
+    #  the number of people in it
+    def random_positions(self, tile: slice) -> np.ndarray:
+        positions: np.ndarray = self.rng.uniform(size=(tile.stop - tile.start, 2))
+        positions[:,0] *= self.map_size
+        low: float = self.map_size * tile.start / self.num_people()
+        high: float = self.map_size * tile.stop / self.num_people()
+        positions[:,1] = low + (high - low) * positions[:,1]
+        return positions
+
+    # The first few people are all in the same band, so the initial cases
+    #  have to be picked at random
+    def initial_cases(self, initial_cases: int) -> np.ndarray:
+        return np.sort(
+            self.rng.choice(
+                self.num_people(),
+                size=min(initial_cases, self.num_people()),
+                replace=False))
+
+
+    # Checks each tile against the infected people near it
+    # The infected people and each tile's healthy people are put together and
+    #  handed to the contact backend as a population of their own. Yields each
+    #  tile with a healthy person in it, along with where its healthy people
+    #  are in the tile and how many infected people each of them is near.
+    def tile_transmitting(self) -> Iterator[Tuple[slice, np.ndarray, np.ndarray]]:
+        flat_positions: np.ndarray = self.positions.reshape((-1, 2))
+        flat_healths: np.ndarray = self.healths.reshape(-1)
+        sources: np.ndarray = \
+            np.concatenate([np.empty(shape=(0, 2), dtype=flat_positions.dtype)] + [
+                flat_positions[tile][flat_healths[tile] == Model.INFECTED]
+                for tile in self.tiles()
+            ])
+        if len(sources) == 0:
+            return
+        # Pad the bounding boxes a little, so that rounding can never leave out
+        #  someone the exact test would count
+        reach: float = self.infection_distance * (1 + 1e-6) + 1e-6 * self.map_size
+        for tile in self.tiles():
+            healthy: np.ndarray = np.flatnonzero(flat_healths[tile] == Model.HEALTHY)
+            if len(healthy) == 0:
+                continue
+            targets: np.ndarray = flat_positions[tile][healthy]
+            low: np.ndarray = targets.min(axis=0) - reach
+            high: np.ndarray = targets.max(axis=0) + reach
+            near: np.ndarray = sources[np.all((sources >= low) & (sources <= high), axis=1)]
+            if len(near) == 0:
+                continue
+            yield \
+                tile, \
+                healthy, \
+                self.contact.people_transmitting(
+                    np.concatenate((near, targets)),
+                    np.arange(len(near) + len(targets)) < len(near),
+                    np.arange(len(near) + len(targets)) >= len(near),
+                    self.infection_distance,
+                )[len(near):]
+
+    # The inherited one needs everyone in memory at once, so this counts a
+    #  tile at a time
+    # The counts themselves are the size of the whole population, so stepping
+    #  the model doesn't use this
+    def people_transmitting(self) -> np.ndarray:
+        counts: np.ndarray = np.zeros(shape=(self.num_people(),), dtype=np.int64)
+        for tile, healthy, found in self.tile_transmitting():
+            counts = counts.astype(np.result_type(counts, found), copy=False)
+            counts[tile.start + healthy] = found
+        return counts
+
+    # Rolls for each tile as soon as it's been counted
+    def newly_infected(self) -> np.ndarray:
+        infected: List[np.ndarray] = [np.empty(0, dtype=np.intp)]
+        for tile, healthy, transmitting in self.tile_transmitting():
+            exposed: np.ndarray = np.flatnonzero(transmitting)
+            infected.append(
+                tile.start + healthy[exposed[
+                    contact.roll_infections(self.rng, transmitting[exposed], self.p_infect)]])
+        return np.concatenate(infected)
+
+    def count_healths(self) -> np.ndarray:
+        flat_healths: np.ndarray = self.healths.reshape(-1)
+        return sum(
+            (np.bincount(flat_healths[tile], minlength=4) for tile in self.tiles()),
+            np.zeros(shape=(4,), dtype=np.int64))
+
+
+    # Everyone's state is already on disk, so it's left out of the state
+    def population_state(self) -> Dict[str, np.ndarray]:
+        return {}
+    def restore_population(self, state: Dict[str, np.ndarray]) -> None:
+        pass
+
+    # Makes sure everything on disk is up to date, so the run can be picked
+    #  back up from the storage directory
+    def sync(self) -> None:
+        self.positions.flush()
+        self.healths.flush()
+        self.infection_end.flush()
+        write_state(self.state(), os.path.join(self.storage, 'state.npz'))
+
+    # Picks a run back up from its storage directory, as of the last `sync`
+    @classmethod
+    def open(cls, storage: str, **kwargs) -> OutOfCoreModel:
+        with np.load(os.path.join(storage, 'state.npz')) as data:
+            state: Dict[str, np.ndarray] = {k: data[k] for k in data.files}
+        return cls.from_state(state, storage=storage, resume=True, **kwargs)
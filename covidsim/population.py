@@ -0,0 +1,199 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Iterator, Optional, Tuple, Union
+
+# Needed for efficient distance calculation
+import numpy as np
+# Needed for fast neighbor search
+import contact
+# Needed for the health codes, and for looking at a model's people
+from model import Model
+
+
+# Lets people be written about one at a time, like in the tutorial's
+#  `calcDistance.py`, while everything is really kept in arrays
+# A `Population` holds everyone's positions and healths in the same arrays the
+#  model uses, so looking at a model's population doesn't copy anything, and
+#  changing someone changes the model. Indexing or iterating over it gives
+#  `Person` views, which only hold where that person is in the arrays. Anything
+#  that looks at lots of people at once, like distances, neighbors or everyone
+#  with some health, is done over the arrays in one go.
+# Filtering gives another `Population` over the same arrays, with just the
+#  people that passed.
+
+
+# One person in a population
+# Reading and writing the attributes goes straight to the arrays
+class Person:
+
+    __slots__ = ['population', 'index']
+
+    def __init__(self, population: Population, index: int) -> None:
+        self.population: Population = population
+        # Where this person is in the arrays
+        self.index: int = index
+
+    @property
+    def x(self) -> float:
+        return float(self.population.positions[self.index,0])
+    @x.setter
+    def x(self, value: float) -> None:
+        self.population.positions[self.index,0] = value
+
+    @property
+    def y(self) -> float:
+        return float(self.population.positions[self.index,1])
+    @y.setter
+    def y(self, value: float) -> None:
+        self.population.positions[self.index,1] = value
+
+    @property
+    def health(self) -> Model.Health:
+        return self.population.healths[self.index]
+    @health.setter
+    def health(self, value: Model.Health) -> None:
+        self.population.healths[self.index] = value
+
+    # Same as in the tutorial
+    def calc_distance(self, other: Person) -> float:
+        dx: float = self.x - other.x
+        dy: float = self.y - other.y
+        return (dx**2 + dy**2)**0.5
+
+    # Everyone in the whole population within some distance of this person,
+    #  including them
+    def neighbors(self, radius: float) -> Population:
+        return self.population.everyone().within(self, radius)
+
+    def __repr__(self) -> str:
+        return f"Person({self.index}, x={self.x}, y={self.y}, health={self.health})"
+
+
+# Where a person or a point is, as an array
+def point_of(where: Union[Person, Tuple[float, float]]) -> np.ndarray:
+    if isinstance(where, Person):
+        return np.array([where.x, where.y])
+    return np.asarray(where, dtype=np.float64)
+
+
+class Population:
+
+    # `positions` is (n,2) and `healths` is (n,)
+    # If given, `indices` picks out who's in this population, out of
+    #  everyone in the arrays
+    def __init__(
+      self,
+      positions: np.ndarray,
+      healths: np.ndarray,
+      indices: Optional[np.ndarray] = None,
+    ) -> None:
+        self.positions: np.ndarray = positions
+        self.healths: np.ndarray = healths
+        self.indices: Optional[np.ndarray] = indices
+
+    # Everyone in a model, as it runs
+    # Note that active set compaction moves people around in the arrays, so
+    #  people from before a step might be someone else after it
+    @classmethod
+    def of(cls, model: Model) -> Population:
+        return cls(model.positions.reshape((-1, 2)), model.healths.reshape(-1))
+
+    # A new population of healthy people, placed at random like the model does
+    @classmethod
+    def random(
+      cls,
+      pop_size: int,
+      map_size: float = 100.0,
+      rng: Optional[np.random.Generator] = None,
+    ) -> Population:
+        rng = rng if rng is not None else np.random.default_rng()
+        return cls(
+            rng.uniform(0.0, map_size, size=(pop_size, 2)),
+            np.full(pop_size, Model.HEALTHY, dtype=Model.Health))
+
+    # The same arrays, with everyone in them
+    def everyone(self) -> Population:
+        return Population(self.positions, self.healths)
+
+    # Where the people in this population are in the arrays
+    def members(self) -> np.ndarray:
+        return np.arange(len(self.healths)) if self.indices is None else self.indices
+
+    # The positions and healths of just the people in this population
+    # These are copies if the population is filtered
+    def xy(self) -> np.ndarray:
+        return self.positions if self.indices is None else self.positions[self.indices]
+    def health(self) -> np.ndarray:
+        return self.healths if self.indices is None else self.healths[self.indices]
+
+
+    def __len__(self) -> int:
+        return len(self.healths) if self.indices is None else len(self.indices)
+
+    # The `i`th person in this population
+    def __getitem__(self, i: int) -> Person:
+        if self.indices is None:
+            if not -len(self) <= i < len(self):
+                raise IndexError(f"Person {i} is out of range for {len(self)} people")
+            return Person(self, int(i) % len(self))
+        return Person(self, int(self.indices[i]))
+
+    def __iter__(self) -> Iterator[Person]:
+        for index in self.members():
+            yield Person(self, int(index))
+
+
+    # Just the people with some health
+    def with_health(self, health: Model.Health) -> Population:
+        return self.where(self.health() == health)
+
+    # Just the people for whom `mask` is true, in order
+    def where(self, mask: np.ndarray) -> Population:
+        return Population(self.positions, self.healths, self.members()[mask])
+
+    # How far everyone is from a person or an (x, y) point
+    def distances_to(self, where: Union[Person, Tuple[float, float]]) -> np.ndarray:
+        delta: np.ndarray = self.xy() - point_of(where)
+        return np.sqrt(delta[:,0]**2 + delta[:,1]**2)
+
+    # Just the people within `radius` of a person or a point
+    # This uses the same test as the contact step, so it agrees with it even
+    #  for people right at the edge
+    def within(self, where: Union[Person, Tuple[float, float]], radius: float) -> Population:
+        xy: np.ndarray = self.xy()
+        return self.where(contact.within(xy, np.broadcast_to(point_of(where), xy.shape), radius))
+
+    # The distance between everyone here and everyone in `others`, as a
+    #  (len(self), len(others)) array
+    # This is the tutorial's table of distances, so it's quadratic in memory
+    def distances(self, others: Optional[Population] = None) -> np.ndarray:
+        others = others if others is not None else self
+        delta: np.ndarray = self.xy()[:,None,:] - others.xy()[None,:,:]
+        return np.sqrt(delta[...,0]**2 + delta[...,1]**2)
+
+    # How many of `others` each person here is within `radius` of
+    # This uses the grid search, so it stays fast however many people there are
+    def count_within(self, others: Population, radius: float) -> np.ndarray:
+        if len(self) == 0 or len(others) == 0:
+            return np.zeros(len(self), dtype=np.int64)
+        return contact.grid_counts(others.xy(), self.xy(), radius)
+
+
+
+# The tutorial's loop over everyone, written against a `Population`, timed
+#  against doing the same thing in one go
+if __name__ == '__main__':
+    import timeit
+    for pop_size in [300, 3000, 30000]:
+        population: Population = Population.random(pop_size)
+        population.healths[:pop_size // 10] = Model.INFECTED
+        infected: Population = population.with_health(Model.INFECTED)
+        def one_at_a_time() -> int:
+            # Loop over the people, but let the arrays do the inner loop
+            return sum(len(infected.within(person, 2.0)) > 0 for person in population.with_health(Model.HEALTHY))
+        def all_at_once() -> int:
+            return int(np.count_nonzero(population.with_health(Model.HEALTHY).count_within(infected, 2.0)))
+        assert one_at_a_time() == all_at_once()
+        print(pop_size,
+              f"one at a time {timeit.timeit(one_at_a_time, number=1):.4f} s,",
+              f"all at once {timeit.timeit(all_at_once, number=1):.4f} s")
@@ -0,0 +1,190 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Union
+
+# Needed for timing and keeping the histograms
+import atexit
+import bisect
+import functools
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+
+# Times how long each phase of a tick takes, while the model runs
+# A phase is just a method on some object, like `tick_locations` on the model.
+#  Attaching the profiler to an object wraps those methods on that one
+#  object, and detaching puts them back, so a model that isn't being profiled
+#  doesn't pay anything at all.
+# Every phase keeps a running histogram of how long each call took. If
+#  allocations are being traced, it also keeps the most memory each call
+#  allocated on top of what was there when it started. That needs tracemalloc,
+#  which slows everything down quite a bit, so it's off by default. The
+#  memory is counted for the whole process, so when phases run on more than
+#  one thread at once, like the model and the viewer, they see each other's.
+# Phases can call each other, like `tick_healths` calling
+#  `people_transmitting`, and the time for the outer one includes the inner one.
+
+
+# The phases of the model, and of the viewer
+MODEL_PHASES: List[str] = ['tick_locations', 'people_transmitting', 'tick_healths', 'tick_stats']
+VIEWER_PHASES: List[str] = ['health_colors', 'tick_map', 'show']
+
+# The edges of the histogram bins, in seconds
+# There are four bins to every factor of ten, from a microsecond to 100 seconds
+EDGES: List[float] = [10 ** (e / 4) for e in range(-24, 9)]
+
+
+# The running statistics for one phase
+class PhaseStats:
+
+    def __init__(self) -> None:
+        self.calls: int = 0
+        self.total: float = 0.0
+        self.least: float = float('inf')
+        self.most: float = 0.0
+        # `histogram[i]` counts the calls that took between `EDGES[i-1]` and
+        #  `EDGES[i]`, with one more bin at each end for anything outside
+        self.histogram: List[int] = [0] * (len(EDGES) + 1)
+        self.peak_bytes: int = 0
+        self.total_peak_bytes: int = 0
+
+    def record(self, seconds: float, peak_bytes: int = 0) -> None:
+        self.calls += 1
+        self.total += seconds
+        self.least = min(self.least, seconds)
+        self.most = max(self.most, seconds)
+        self.histogram[bisect.bisect(EDGES, seconds)] += 1
+        self.peak_bytes = max(self.peak_bytes, peak_bytes)
+        self.total_peak_bytes += peak_bytes
+
+    # Estimates the time that some fraction of calls were faster than, from
+    #  the histogram
+    # This is only as accurate as the bins are narrow
+    def quantile(self, q: float) -> float:
+        seen: int = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if seen >= q * self.calls and count > 0:
+                return min(EDGES[min(i, len(EDGES) - 1)], self.most)
+        return self.most
+
+    def summary(self) -> Dict[str, Any]:
+        if self.calls == 0:
+            return {'calls': 0}
+        return {
+            'calls': self.calls,
+            'total_seconds': self.total,
+            'mean_seconds': self.total / self.calls,
+            'min_seconds': self.least,
+            'max_seconds': self.most,
+            'p50_seconds': self.quantile(0.5),
+            'p90_seconds': self.quantile(0.9),
+            'p99_seconds': self.quantile(0.99),
+            'histogram': self.histogram,
+            'mean_peak_bytes': self.total_peak_bytes / self.calls,
+            'max_peak_bytes': self.peak_bytes,
+        }
+
+
+class Profiler:
+
+    # If `dump_at_exit` is set, the statistics get written out when Python
+    #  exits, to a JSON file if it's a path and printed as a table if it's
+    #  just `True`
+    def __init__(
+      self,
+      trace_allocations: bool = False,
+      dump_at_exit: Union[bool, str] = False,
+    ) -> None:
+        self.trace_allocations: bool = trace_allocations
+        self.phases: Dict[str, PhaseStats] = {}
+        # Each thread has its own stack of the phases it's in, for working out
+        #  the memory of phases inside of other phases
+        self.local: threading.local = threading.local()
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if dump_at_exit:
+            atexit.register(self.dump, None if dump_at_exit is True else dump_at_exit)
+
+    # Wraps the given methods of an object so they get timed
+    def attach(self, obj: Any, names: List[str]) -> None:
+        for name in names:
+            self.phases.setdefault(name, PhaseStats())
+            setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+    # Puts the original methods back
+    def detach(self, obj: Any, names: List[str]) -> None:
+        for name in names:
+            if name in vars(obj):
+                delattr(obj, name)
+
+    def wrap(self, name: str, method: Callable) -> Callable:
+        stats: PhaseStats = self.phases[name]
+        if not self.trace_allocations:
+            @functools.wraps(method)
+            def timed(*args, **kwargs):
+                start: float = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    stats.record(time.perf_counter() - start)
+            return timed
+
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            # The peak is shared by everything, so phases inside this one have
+            #  to pass theirs up through the stack
+            stack: List[List[int]] = self.stack()
+            current, peak = tracemalloc.get_traced_memory()
+            if len(stack) > 0:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            stack.append([current, 0])
+            start: float = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds: float = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                started, inner = stack.pop()
+                peak = max(peak, inner)
+                if len(stack) > 0:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                tracemalloc.reset_peak()
+                stats.record(seconds, peak - started)
+        return traced
+
+    def stack(self) -> List[List[int]]:
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+
+    # The statistics for every phase, as a dictionary
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.summary() for name, stats in self.phases.items()}
+
+    # One line per phase, with the typical times in milliseconds
+    def report(self) -> str:
+        lines: List[str] = []
+        for name, stats in self.phases.items():
+            if stats.calls == 0:
+                continue
+            line: str = \
+                f"{name}: {stats.calls} calls, mean {1000 * stats.total / stats.calls:.2f} ms, " \
+                f"p90 {1000 * stats.quantile(0.9):.2f} ms, max {1000 * stats.most:.2f} ms"
+            if self.trace_allocations:
+                line += f", peak {stats.peak_bytes / 2**20:.1f} MiB"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    # Writes the statistics to a JSON file, or prints them if there isn't one
+    def dump(self, path: Optional[str] = None) -> None:
+        if path is None:
+            print(self.report(), file=sys.stderr)
+            return
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
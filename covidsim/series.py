@@ -0,0 +1,85 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Dict, Tuple
+
+# Needed for the preallocated storage
+import numpy as np
+
+
+# An array that grows along its first axis as rows are appended
+# The storage is preallocated and doubles when it runs out, so appending is
+#  amortized constant time. That keeps recording statistics every timestep
+#  from getting slower as the run goes on.
+class Series:
+
+    def __init__(
+      self,
+      row_shape: Tuple[int, ...] = (),
+      dtype: type = np.int64,
+      capacity: int = 1024,
+    ) -> None:
+        self.length: int = 0
+        self.data: np.ndarray = np.zeros(shape=(capacity,) + row_shape, dtype=dtype)
+
+    def __len__(self) -> int:
+        return self.length
+
+    # The rows appended so far
+    # This is a view into the storage, so it's only good until the next append
+    @property
+    def view(self) -> np.ndarray:
+        return self.data[:self.length]
+
+    def append(self, row: np.ndarray) -> None:
+        if self.length == len(self.data):
+            grown: np.ndarray = \
+                np.zeros(
+                    shape=(2*len(self.data),) + self.data.shape[1:],
+                    dtype=self.data.dtype)
+            grown[:self.length] = self.data
+            self.data = grown
+        self.data[self.length] = row
+        self.length += 1
+
+    # Replaces the contents with the given rows
+    def assign(self, rows: np.ndarray) -> None:
+        self.length = 0
+        self.data = \
+            np.zeros(
+                shape=(max(len(rows), 1024),) + self.data.shape[1:],
+                dtype=self.data.dtype)
+        self.data[:len(rows)] = rows
+        self.length = len(rows)
+
+
+# Writes a table of equal-length columns out in batches of rows, so the whole
+#  table never has to be converted to text or Arrow at once
+# The format is picked from the file extension: `.csv` or `.parquet`. Parquet
+#  needs PyArrow, which the rest of the simulation doesn't.
+def write_table(
+  path: str,
+  columns: Dict[str, np.ndarray],
+  batch_rows: int = 65536,
+) -> None:
+    length: int = len(next(iter(columns.values())))
+    if path.endswith('.parquet'):
+        import pyarrow
+        import pyarrow.parquet
+        schema = pyarrow.schema([(k, pyarrow.from_numpy_dtype(v.dtype)) for k, v in columns.items()])
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            for start in range(0, length, batch_rows):
+                writer.write_table(
+                    pyarrow.table(
+                        {k: v[start:start+batch_rows] for k, v in columns.items()},
+                        schema=schema))
+    elif path.endswith('.csv'):
+        with open(path, 'w') as f:
+            f.write(','.join(columns) + '\n')
+            for start in range(0, length, batch_rows):
+                np.savetxt(
+                    f,
+                    np.column_stack([v[start:start+batch_rows] for v in columns.values()]),
+                    fmt=[('%d' if np.issubdtype(v.dtype, np.integer) else '%g') for v in columns.values()],
+                    delimiter=',')
+    else:
+        raise ValueError(f"Don't know how to write a table to {path}")
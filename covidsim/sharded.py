@@ -0,0 +1,304 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+
+# Needed for running on every core
+import multiprocessing
+import multiprocessing.connection
+import os
+from multiprocessing import shared_memory
+
+# Needed for the arrays in shared memory
+import numpy as np
+# Needed for fast neighbor search
+import contact
+# The model we're splitting up
+from model import Model
+
+
+# Runs one model on every core by splitting the map into vertical strips
+# Everyone's position, health and infection end time live in shared memory.
+#  Each strip is looked after by its own worker process, which moves the
+#  people in it and works out who they infect. After moving, people who
+#  crossed into another strip are handed over to its worker. Before infecting,
+#  every worker sends its neighbors the infected people within the infection
+#  distance of their border, which is all they need to see of each other.
+# The main process only does the work that's proportional to the number of
+#  events, so it doesn't hold things up: passing messages, keeping the
+#  schedule of when infections end, and deciding who recovers.
+# Every worker has its own random stream, spawned from the model's seed, so
+#  runs are statistically the same as `Model` but not identical to it.
+# Use it like
+#   with ShardedModel(workers=4, pop_size=1000000, map_size=1400.0) as model:
+#       model.run(n_ticks)
+class ShardedModel(Model):
+
+    # Takes the same arguments as `Model`, along with the number of worker
+    #  processes to use, which defaults to one for every core
+    # Strips are never narrower than the infection distance, so the map might
+    #  not get split up as many ways as asked
+    def __init__(self, workers: Optional[int] = None, **kwargs) -> None:
+        self.workers: int = workers if workers is not None else os.cpu_count()
+        self.shared: Dict[str, shared_memory.SharedMemory] = {}
+        # The connections to the worker processes, once they've been started
+        self.connections: List[multiprocessing.connection.Connection] = []
+        self.processes: List[multiprocessing.Process] = []
+        # The infected people near each worker's edges, if nobody's health
+        #  has changed since they were found
+        self.halos: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+        if kwargs.get('active_set', False):
+            raise ValueError(f"{type(self).__name__} doesn't support active set compaction")
+        super().__init__(**kwargs)
+        self.shards: int = \
+            max(1, min(self.workers, int(self.map_size // max(self.infection_distance, 1e-9))))
+
+    # The main process never moves anyone itself, so it only needs a little
+    #  scratch space for creating everyone
+    def tile_size(self) -> int:
+        return 2**16
+
+    # Everyone's state goes in shared memory
+    def new_array(self, name: str, shape: Tuple[int, ...], dtype: type) -> np.ndarray:
+        size: int = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        memory: shared_memory.SharedMemory = shared_memory.SharedMemory(create=True, size=size)
+        self.shared[name] = memory
+        return np.ndarray(shape=shape, dtype=dtype, buffer=memory.buf)
+
+    # Copies into the shared memory, rather than replacing it
+    def restore_population(self, state: Dict[str, np.ndarray]) -> None:
+        self.positions[...] = state['positions']
+        self.healths[...] = state['healths']
+        self.infection_end[...] = state['infection_end']
+
+
+    # Starts the workers, if they haven't been already
+    # This waits until the first step, so that everyone is where they should
+    #  be if the model was restored from some state
+    def start(self) -> None:
+        if len(self.processes) > 0:
+            return
+        layout: Dict[str, Tuple[str, Tuple[int, ...], str]] = {
+            name: (self.shared[name].name, array.shape, array.dtype.str)
+            for name, array in [
+                ('positions', self.positions),
+                ('healths', self.healths),
+            ]
+        }
+        seeds: List[np.random.SeedSequence] = \
+            np.random.SeedSequence(self.rng.integers(2**63)).spawn(self.shards)
+        for shard in range(self.shards):
+            ours, theirs = multiprocessing.Pipe()
+            process: multiprocessing.Process = \
+                multiprocessing.Process(
+                    target=run_shard,
+                    args=(
+                        theirs,
+                        layout,
+                        shard,
+                        self.shards,
+                        self.map_size,
+                        self.infection_distance,
+                        self.p_infect,
+                        self.contact.name,
+                        self.contact.options(),
+                        seeds[shard],
+                    ),
+                    daemon=True)
+            process.start()
+            self.connections.append(ours)
+            self.processes.append(process)
+        # Wait for every worker to find the people in its strip before anyone
+        #  moves
+        for connection in self.connections:
+            connection.recv()
+
+    # Sends each worker its own message, and returns all their replies
+    def exchange(self, messages: List[tuple]) -> List[object]:
+        for connection, message in zip(self.connections, messages):
+            connection.send(message)
+        return [connection.recv() for connection in self.connections]
+
+
+    # Everyone moves, then the people who left their strip are handed over
+    def tick_locations(self, step_mean: np.float64 = 2.0) -> None:
+        self.start()
+        moved: List[Tuple[np.ndarray, np.ndarray]] = \
+            self.exchange([('move', step_mean, self.p_movement)] * self.shards)
+        leaving: np.ndarray = np.concatenate([m[0] for m in moved])
+        destinations: np.ndarray = np.concatenate([m[1] for m in moved])
+        self.halos = \
+            self.exchange([('migrate', leaving[destinations == s]) for s in range(self.shards)])
+
+    # The infected people from the edges of each worker's neighbors
+    # Moving finds them along the way. Otherwise, like when the health phase
+    #  is run on its own, the workers are asked for them.
+    def neighbor_halos(self) -> List[np.ndarray]:
+        self.start()
+        if self.halos is None:
+            self.halos = self.exchange([('edges',)] * self.shards)
+        empty: np.ndarray = np.empty(0, dtype=np.intp)
+        return [
+            np.concatenate((
+                self.halos[s-1][1] if s > 0 else empty,
+                self.halos[s+1][0] if s < self.shards - 1 else empty,
+            ))
+            for s in range(self.shards)
+        ]
+
+    # Each worker counts for its own people, with the edges of its neighbors
+    # The inherited one would check everyone at once in the main process
+    def people_transmitting(self) -> np.ndarray:
+        counted: List[Tuple[np.ndarray, np.ndarray]] = \
+            self.exchange([('transmitting', halo) for halo in self.neighbor_halos()])
+        counts: np.ndarray = \
+            np.zeros(
+                shape=(self.num_people(),),
+                dtype=np.result_type(*[found.dtype for _, found in counted]))
+        for healthy, found in counted:
+            counts[healthy] = found
+        return counts
+
+    # Each worker gets the edges of its neighbors, and infects its own people
+    def newly_infected(self) -> np.ndarray:
+        infected: np.ndarray = \
+            np.concatenate(self.exchange([('infect', halo) for halo in self.neighbor_halos()]))
+        # The edges now leave out everyone who just got infected
+        self.halos = None
+        return infected
+
+    def count_healths(self) -> np.ndarray:
+        self.start()
+        return sum(self.exchange([('count',)] * self.shards))
+
+
+    # Stops the workers and gives back the shared memory
+    # Everyone's state is copied out first, so the model can still be looked
+    #  at afterwards, but it can't be stepped any more
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.send(('stop',))
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+        if len(self.shared) == 0:
+            return
+        self.positions = self.positions.copy()
+        self.healths = self.healths.copy()
+        self.infection_end = self.infection_end.copy()
+        for memory in self.shared.values():
+            memory.close()
+            memory.unlink()
+        self.shared = {}
+
+    def __enter__(self) -> ShardedModel:
+        return self
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+# Looks after one strip of the map
+# This is what runs in the worker processes, so it has to be at the top level
+#  of the module
+# It waits for commands from the main process and replies to each one
+def run_shard(
+  connection: multiprocessing.connection.Connection,
+  layout: Dict[str, Tuple[str, Tuple[int, ...], str]],
+  shard: int,
+  shards: int,
+  map_size: np.float64,
+  infection_distance: np.float64,
+  p_infect: float,
+  contact_backend: str,
+  contact_options: Dict[str, Any],
+  seed: np.random.SeedSequence,
+) -> None:
+    memories: Dict[str, shared_memory.SharedMemory] = \
+        {name: shared_memory.SharedMemory(name=n) for name, (n, _, _) in layout.items()}
+    arrays: Dict[str, np.ndarray] = {
+        name: np.ndarray(shape=shape, dtype=np.dtype(dtype), buffer=memories[name].buf)
+        for name, (_, shape, dtype) in layout.items()
+    }
+    positions: np.ndarray = arrays['positions'].reshape((-1, 2))
+    healths: np.ndarray = arrays['healths'].reshape(-1)
+    rng: np.random.Generator = np.random.default_rng(seed)
+    backend: contact.ContactBackend = contact.make_backend(contact_backend, map_size, contact_options)
+
+    # Which strip someone at each x coordinate is in
+    width: float = map_size / shards
+    def strip(x: np.ndarray) -> np.ndarray:
+        return np.clip((x / width).astype(np.intp), 0, shards - 1)
+    low: float = shard * width
+    high: float = (shard + 1) * width
+    # Pad the edges a little, so that rounding can never leave out someone the
+    #  exact test would count
+    reach: float = infection_distance * (1 + 1e-6) + 1e-6 * map_size
+
+    # The (flat) indices of everyone in our strip, and of the infected ones
+    ours: np.ndarray = np.flatnonzero(strip(positions[:,0]) == shard)
+    infected: np.ndarray = np.empty(0, dtype=np.intp)
+    connection.send(len(ours))
+
+    # Same as `Model.people_transmitting`, with the infected people from our
+    #  neighbors' edges added in
+    # Returns our healthy people, and how many infected people each is near
+    def transmitting(halo: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        sources: np.ndarray = positions[np.concatenate((infected, halo))]
+        healthy: np.ndarray = ours[healths[ours] == Model.HEALTHY]
+        if len(sources) == 0 or len(healthy) == 0:
+            return healthy, np.zeros(shape=(len(healthy),), dtype=np.int64)
+        return \
+            healthy, \
+            backend.people_transmitting(
+                np.concatenate((sources, positions[healthy])),
+                np.arange(len(sources) + len(healthy)) < len(sources),
+                np.arange(len(sources) + len(healthy)) >= len(sources),
+                infection_distance,
+            )[len(sources):]
+
+    while True:
+        command, *args = connection.recv()
+        if command == 'move':
+            # Same as `Model.tick_locations`, but only for the people in our
+            #  strip
+            step_mean, p_movement = args
+            mine: np.ndarray = positions[ours]
+            steps: np.ndarray = rng.normal(scale=np.sqrt(step_mean/2), size=mine.shape)
+            steps[(healths[ours] == Model.DECEASED) | (rng.random(len(ours)) >= p_movement)] = 0
+            mine += steps
+            np.clip(mine, 0.0, map_size, out=mine)
+            positions[ours] = mine
+            # Hand over whoever left
+            destinations: np.ndarray = strip(mine[:,0])
+            leaving: np.ndarray = destinations != shard
+            connection.send((ours[leaving], destinations[leaving]))
+            ours = ours[~leaving]
+        elif command in ['migrate', 'edges']:
+            # Take in any new arrivals, then tell our neighbors who's infected
+            #  near each of our edges
+            if command == 'migrate':
+                arrivals, = args
+                ours = np.concatenate((ours, arrivals))
+            infected = ours[healths[ours] == Model.INFECTED]
+            x: np.ndarray = positions[infected,0]
+            connection.send((infected[x <= low + reach], infected[x >= high - reach]))
+        elif command == 'transmitting':
+            halo, = args
+            connection.send(transmitting(halo))
+        elif command == 'infect':
+            # Same as `Model.newly_infected`
+            halo, = args
+            healthy, counts = transmitting(halo)
+            exposed: np.ndarray = np.flatnonzero(counts)
+            newly: np.ndarray = \
+                healthy[exposed[contact.roll_infections(rng, counts[exposed], p_infect)]]
+            healths[newly] = Model.INFECTED
+            connection.send(newly)
+        elif command == 'count':
+            connection.send(np.bincount(healths[ours], minlength=4))
+        elif command == 'stop':
+            break
+
+    del positions, healths, arrays
+    for memory in memories.values():
+        memory.close()
@@ -1,96 +1,105 @@
 # Nice to have type hinting
 from __future__ import annotations
-from typing import List, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Needed for parsing arguments, and finding and caching the map
+import argparse
+import functools
+import os
 
 # Needed for some functions
 from math import ceil
 
-# Needed for efficient distance calculation
+# Needed for working with the model's arrays
 import numpy as np
+# The thing we're simulating
+from model import Model, Snapshot
+# Needed for running the model in the background
+from worker import ModelWorker
+# Needed for saving and resuming runs
+from checkpoint import Checkpointer, load_checkpoint
+# Needed for timing each phase
+from profiling import Profiler, MODEL_PHASES, VIEWER_PHASES
 
-# Needed for plotting
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import matplotlib.image as image
-import matplotlib.widgets as widgets
-import matplotlib.patches as mpatches
+# Plotting needs matplotlib, which is slow to import. It's only imported once
+#  something actually gets drawn, so that importing this file stays cheap for
+#  everything that doesn't draw.
 
 
-class Simulation:
+# The color to draw people with each health in, indexed by their health
+HEALTH_COLORS: List[str] = ['blue', 'red', 'green', 'black']
+HEALTH_LABELS: List[str] = ['Healthy', 'Infected', 'Recovered', 'Deceased']
+# The background of the map, found next to this file rather than wherever
+#  we're being run from
+MAP_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img', 'map.png')
+# The most timesteps drawn along each statistics curve
+# Longer runs only draw every few timesteps, so a frame costs the same however
+#  long the run has gone on
+MAX_DRAWN: int = 1024
+
 
-    # Define constants to keep track of people's health
-    # We can't use an enum for this since they can't efficiently be put into
-    #  numpy arrays
-    Health = np.ubyte
-    HEALTHY: Simulation.Health = 0
-    INFECTED: Simulation.Health = 1
-    RECOVERED: Simulation.Health = 2
-    DECEASED: Simulation.Health = 3
+# The health colors, already converted to RGBA so that coloring everyone is
+#  just one lookup into this table
+@functools.lru_cache(maxsize=None)
+def palette() -> np.ndarray:
+    import matplotlib.colors as mcolors
+    return mcolors.to_rgba_array(HEALTH_COLORS)
 
+# The decoded map image
+# Decoding it is slow, so it's only done once per process, and every viewer
+#  shares the same read-only copy
+@functools.lru_cache(maxsize=None)
+def map_image(path: str = MAP_PATH) -> np.ndarray:
+    import matplotlib.image as image
+    decoded: np.ndarray = image.imread(path)
+    decoded.flags.writeable = False
+    return decoded
+
+
+# The interactive viewer for the model in `model.py`
+# All the simulating happens in there. This just draws it, and lets you poke
+#  at it with some check buttons.
+class Simulation:
 
+    # Either shows an existing model, or takes the same arguments as `Model`
+    #  to create a new one
+    # Optionally, the model is checkpointed to a file every so often and when
+    #  the window is closed
+    # If it's not interactive, the model isn't run and there are no buttons.
+    #  Snapshots are only drawn when they're passed to `show`.
+    # If given a profiler, it times both the model and the drawing, and what
+    #  it has so far is shown over the map
     def __init__(
       self,
-      pop_size: int = 5000,
-      initial_cases: int = 1,
-      hospital_beds_ratio: float = .003,
-      infection_distance: np.float64 = 2.0,
-      infection_time: np.uint64 = 20,
-      p_infect: float = 0.3,
-      p_recover: float = 0.7,
-      map_size: np.float64 = 100.0,
+      model: Optional[Model] = None,
+      checkpoint: Optional[str] = None,
+      checkpoint_every: int = 100,
+      interactive: bool = True,
+      profiler: Optional[Profiler] = None,
+      **kwargs,
     ) -> None:
 
-        # Simulation starts at time t=0
-        self.time: int = 0
-
-        # Keep track of the population size for this simulation
-        self.pop_size: int = pop_size
-        # Also the other parameters given
-        self.map_size: np.float64 = map_size
-        self.infection_distance: np.float64 = infection_distance
-        self.infection_time: np.uint64 = infection_time
-        self.p_infect: float = p_infect
-        self.p_recover: float = p_recover
-        self.p_die: float = 1 - p_recover
-        self.hospital_beds_ratio: float = hospital_beds_ratio
-
-        # Position and health of everyone in the population
-        self.positions: np.ndarray = \
-            np.random.uniform(
-                low=0.0,
-                high=self.map_size,
-                size=(self.pop_size,2),
-            )
-        self.healths: np.ndarray = \
-            np.full(
-                shape=(self.pop_size,),
-                fill_value=Simulation.HEALTHY,
-                dtype=Simulation.Health,
-            )
-        self.infected_duration: np.ndarray = \
-            np.zeros( shape=(self.pop_size,), dtype=np.uint64 )
-
-        # Note that we don't have to randomly draw from `self.healths`. The
-        #  positions are all generated in the same way, and they're all
-        #  indistinguishable from each other.
-        self.healths[0:initial_cases] = Simulation.INFECTED
-        self.infected_duration[0:initial_cases] = 1
-
-        # Keep track of the statistics too
-        self.infected: List[int] = []
-        self.recovered: List[int] = []
-        self.dead: List[int] = []
-        self.new_cases: List[int] = []
+        # The model we're showing
+        # It runs as fast as it can on its own thread, and we draw whatever it
+        #  has gotten to whenever we have time
+        self.model: Model = model if model is not None else Model(**kwargs)
+        self.worker: Optional[ModelWorker] = \
+            ModelWorker(
+                self.model,
+                Checkpointer(self.model, checkpoint, checkpoint_every)
+                if checkpoint is not None else None) \
+            if interactive else None
+
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as mpatches
 
         # Create the figure for plotting
         self.fig = plt.figure(figsize=(16,9))
         # Legend
         # Keep it on the whole figure since the colors apply to everything
         self.fig.legend(handles=[
-            mpatches.Patch(color='blue', label='Healthy'),
-            mpatches.Patch(color='red', label='Infected'),
-            mpatches.Patch(color='green', label='Recovered'),
-            mpatches.Patch(color='black', label='Deceased'),
+            mpatches.Patch(color=c, label=l)
+            for c, l in zip(HEALTH_COLORS, HEALTH_LABELS)
         ], loc='lower left')
         # Add a grid for layout
         grid = self.fig.add_gridspec(nrows=3, ncols=4)
@@ -98,27 +107,51 @@ class Simulation:
         self.map_ax = self.fig.add_subplot(grid[0:,1:])
         self.stats_ax = self.fig.add_subplot(grid[0,0])
         self.traj_ax = self.fig.add_subplot(grid[1,0])
-        self.check_ax = self.fig.add_subplot(grid[2,0], frame_on=False)
         # Add labels
         self.stats_ax.set_xlabel('Time')
         self.stats_ax.set_ylabel('Cases')
         self.traj_ax.set_xlabel('Log(Total Cases)')
         self.traj_ax.set_ylabel('Log(New Cases)')
+        # Set up everything we draw
+        self.init_map()
+        self.init_stats()
+        self.profiler: Optional[Profiler] = profiler
+        if profiler is not None:
+            profiler.attach(self.model, MODEL_PHASES)
+            profiler.attach(self, VIEWER_PHASES)
+            self.overlay = \
+                self.map_ax.text(
+                    0.01, 0.99, '',
+                    transform=self.map_ax.transAxes,
+                    va='top',
+                    family='monospace',
+                    fontsize='small',
+                    bbox={'facecolor': 'white', 'alpha': 0.8},
+                    animated=True)
+
         # Call for updates
-        self.map_ani = \
-            animation.FuncAnimation(
-                self.fig,
-                self.tick_map,
-                init_func=self.init_map)
-        self.stats_ani = \
-            animation.FuncAnimation(
-                self.fig,
-                self.tick_stats)
+        # Everything that changes is blitted by hand. Each axes has a list of
+        #  animated artists, which are left out whenever the whole figure gets
+        #  drawn. We save what each axes looks like without them, then draw
+        #  them on top. Every tick after that only redraws those artists.
+        self.animated: Dict[Any, List[Any]] = {
+            self.map_ax: [self.scatter] + ([self.overlay] if profiler is not None else []),
+            self.stats_ax: self.areas,
+            self.traj_ax: [self.trajectory],
+        }
+        self.backgrounds: Dict[Any, Any] = {}
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+        if not interactive:
+            return
+        self.timer = self.fig.canvas.new_timer(interval=50)
+        self.timer.add_callback(self.tick)
+        self.timer.start()
 
         # Check buttons and simulation options
         self.paused: bool = False
         self.log_scale: bool = False
-        self.p_movement: float = 1.0
+        self.check_ax = self.fig.add_subplot(grid[2,0], frame_on=False)
+        import matplotlib.widgets as widgets
         self.checks = widgets.CheckButtons(self.check_ax, [
             'Use Log Scale',
             'Total Social Distancing',
@@ -126,122 +159,135 @@ class Simulation:
             'Paused',
         ])
         self.checks.on_clicked(self.checkbox_handler)
-
-
-    # Makes everyone take a step in a random direction with a given mean of
-    #  step length
-    def tick_locations(self, step_mean: np.float64 = 2.0) -> None:
-        # Compute our step if we move
-        # Note the formula for the standard deviation. Distance travelled is
-        #  the square-root of the sum of the squares of two normal random
-        #  variables, giving a chi-squared distribution.
-        dpos = \
-            np.random.normal(
-                scale=np.sqrt(step_mean/2),
-                size=(self.pop_size,2))
-        # We don't want to move everyone
-        # Dead people don't move
-        # For everyone else, we roll some probability of moving, and don't move
-        #  if they miss that roll
-        dpos[
-            (self.healths == Simulation.DECEASED) | \
-            (np.random.binomial(1, self.p_movement, size=(self.pop_size,)) == 0)
-        ] = np.array([0,0])
-        # Acutally update the positions
-        # Make sure we don't step outside the map boundary
-        self.positions += dpos
-        self.positions = np.clip(self.positions, 0.0, self.map_size)
-
-
-    # Returns an array of size (self.pop_size,) containing at index i the
-    #  number of infected people person i is within self.infection_distance of
-    def people_transmitting(self) -> np.ndarray:
-        # Compute the distance between everyone
-        distVectors: np.ndarray = self.positions - self.positions.reshape((self.pop_size,1,2))
-        distMat: np.ndarray = np.sqrt(np.sum(distVectors**2, axis=2))
-        # Figure out whether a person can be infected by another. The ijth
-        #  entry of this matrix will be true iff person i can be infected by
-        #  person j
-        possibilityMat: np.ndarray = \
-            (distMat <= self.infection_distance) * \
-            (self.healths == Simulation.INFECTED) * \
-            (self.healths == Simulation.HEALTHY).reshape((self.pop_size,1))
-        # Sum up how many we can get infected from
-        return np.sum(possibilityMat, axis=1)
-
-
-    # Updates the health of the healthy people to infected if they are near
-    #  someone else who is infected. Also counts how long someone has been
-    #  infected and changes them to recovered if enough time has passed.
-    def tick_healths(self) -> None:
-        # Compute who becomes infected at the current time
-        self.healths[np.random.binomial(self.people_transmitting(), self.p_infect) > 0] = Simulation.INFECTED
-        # Compute who has been infected for a long time
-        self.infected_duration[self.healths == Simulation.INFECTED] += 1
-        infection_done = self.infected_duration >= self.infection_time
-        # Figure out who lives and who dies
-        # Recovery happens with probability `p_recover`
-        self.healths[infection_done] = Simulation.DECEASED
-        self.healths[np.random.binomial(infection_done, self.p_recover) > 0] = Simulation.RECOVERED
-        # If they are recovered or deceased, we don't want to reroll their status
-        self.infected_duration[infection_done] = 0
+        # Start the model, and make sure it stops and the last checkpoint gets
+        #  written when we're done
+        self.worker.start()
+        self.fig.canvas.mpl_connect('close_event', lambda _: self.worker.stop())
 
 
     # Utility function for plotting
-    # Take in the vector of healths and output the colors they should be
-    def health_colors(self) -> np.ndarray:
-        return np.vectorize({
-            Simulation.HEALTHY: 'blue',
-            Simulation.INFECTED: 'red',
-            Simulation.RECOVERED: 'green',
-            Simulation.DECEASED: 'black',
-        }.get)(self.healths)
+    # Take in the vector of healths and output the RGBA colors they should be
+    def health_colors(self, healths: np.ndarray) -> np.ndarray:
+        return palette()[healths]
 
     # Functions for initializing and updating the map
     def init_map(self):
         self.map_ax.imshow(
-            image.imread('img/map.png'),
-            extent=[0, self.map_size, 0, self.map_size],
+            map_image(),
+            extent=[0, self.model.map_size, 0, self.model.map_size],
             aspect='auto')
         self.scatter = \
             self.map_ax.scatter(
-                x=self.positions[:,0],
-                y=self.positions[:,1],
-                c=self.health_colors())
-        return self.scatter
-    def tick_map(self, _):
-        if not self.paused:
-            self.tick_locations()
-            self.tick_healths()
-            self.scatter.set_facecolor(self.health_colors())
-            self.scatter.set_offsets(self.positions)
-            return self.scatter
+                x=self.model.positions[:,0],
+                y=self.model.positions[:,1],
+                c=self.health_colors(self.model.healths),
+                animated=True)
+    def tick_map(self, snapshot: Snapshot) -> None:
+        self.scatter.set_facecolor(self.health_colors(snapshot.healths))
+        self.scatter.set_offsets(snapshot.positions)
 
     # Same for the statistics
-    def tick_stats(self, _):
-        if not self.paused:
-            # Compute the statistics
-            self.time += 1
-            self.infected.append(np.count_nonzero(self.healths == Simulation.INFECTED))
-            self.recovered.append(np.count_nonzero(self.healths == Simulation.RECOVERED))
-            self.dead.append(np.count_nonzero(self.healths == Simulation.DECEASED))
-            # Calculate the cumulatives for the stacked-area plot
-            cum_infected = self.infected
-            cum_recovered = list(map(sum, zip(cum_infected, self.recovered)))
-            cum_dead = list(map(sum, zip(cum_recovered, self.dead)))
-            # Some statistics depend on these cumulatives, so compute them now
-            self.new_cases.append(cum_dead[-1] - (cum_dead[-2] if len(cum_dead) >= 2 else 0))
-            # Plot them
-            self.stats_ax.clear()
-            self.stats_ax.axhline(y=self.hospital_beds_ratio * self.pop_size, color='red', linestyle='--')
-            self.stats_ax.set_yscale('log' if self.log_scale else 'linear')
-            self.stats_ax.fill_between(range(self.time), cum_infected, 0, color='red')
-            self.stats_ax.fill_between(range(self.time), cum_recovered, cum_infected, color='green')
-            self.stats_ax.fill_between(range(self.time), cum_dead, cum_recovered, color='black')
-            # Also update the trajectory
-            self.traj_ax.set_xscale('log')
-            self.traj_ax.set_yscale('log')
-            self.traj_ax.plot(cum_dead, self.new_cases, color='red')
+    # The artists are created once and have their data replaced every tick,
+    #  instead of clearing the axes and plotting everything again
+    def init_stats(self):
+        model: Model = self.model
+        self.stats_ax.axhline(y=model.hospital_beds_ratio * model.pop_size, color='red', linestyle='--')
+        self.areas = [
+            self.stats_ax.fill_between([], [], [], color=c, animated=True)
+            for c in ['red', 'green', 'black']
+        ]
+        self.trajectory, = self.traj_ax.plot([], [], color='red', animated=True)
+        self.traj_ax.set_xscale('log')
+        self.traj_ax.set_yscale('log')
+        # The axes limits only ever double, so that they don't have to be
+        #  redrawn every tick
+        self.stats_ax.set_xlim(0, 64)
+        self.stats_ax.set_ylim(0, 16)
+        self.traj_ax.set_xlim(1, 16)
+        self.traj_ax.set_ylim(1, 16)
+        # The most new cases on any timestep up to `stats_seen`, so the whole
+        #  history doesn't have to be looked over every frame
+        self.stats_seen: int = 0
+        self.most_new_cases: int = 0
+    # Draws the statistics up to the given time
+    # Returns whether any of the axes limits had to change
+    def tick_stats(self, now: int) -> bool:
+        # The model computes the statistics as it steps, so we only draw them
+        # It's already moved on, but the statistics up to now won't change
+        model: Model = self.model
+        if now > self.stats_seen:
+            self.most_new_cases = max(self.most_new_cases, int(model.new_cases[self.stats_seen:now].max()))
+            self.stats_seen = now
+        # Only draw every `stride` timesteps, along with the latest one. The
+        #  stride is a power of two, so the same timesteps keep getting drawn
+        #  until it doubles.
+        stride: int = 2**max(0, ceil(np.log2(max(now, 1) / MAX_DRAWN)))
+        time: np.ndarray = np.arange(0, now, stride)
+        if now > 0 and time[-1] != now - 1:
+            time = np.append(time, now - 1)
+        new_cases: np.ndarray = model.new_cases[time]
+        # Calculate the cumulatives for the stacked-area plot
+        cum_infected: np.ndarray = model.infected[time]
+        cum_recovered: np.ndarray = cum_infected + model.recovered[time]
+        cum_dead: np.ndarray = cum_recovered + model.dead[time]
+        # Plot them
+        for area, top, bottom in zip(
+          self.areas,
+          [cum_infected, cum_recovered, cum_dead],
+          [np.zeros_like(cum_infected), cum_infected, cum_recovered]):
+            area.set_verts([np.concatenate((
+                np.column_stack((time, top)),
+                np.column_stack((time[::-1], bottom[::-1])),
+            ))])
+        # Also update the trajectory
+        self.trajectory.set_data(cum_dead, new_cases)
+        # Make room for everything
+        if now == 0:
+            return False
+        return any([
+            grow_limit(self.stats_ax.get_xlim, self.stats_ax.set_xlim, now),
+            grow_limit(self.stats_ax.get_ylim, self.stats_ax.set_ylim, cum_dead[-1], model.pop_size),
+            grow_limit(self.traj_ax.get_xlim, self.traj_ax.set_xlim, cum_dead[-1], model.pop_size),
+            grow_limit(self.traj_ax.get_ylim, self.traj_ax.set_ylim, self.most_new_cases),
+        ])
+
+    # Saves the backgrounds and draws the animated artists whenever the whole
+    #  figure gets drawn
+    def on_draw(self, _) -> None:
+        for ax, artists in self.animated.items():
+            self.backgrounds[ax] = self.fig.canvas.copy_from_bbox(ax.bbox)
+            for artist in artists:
+                ax.draw_artist(artist)
+
+    # Steps the model and hands back snapshots of it, like `Model.iter_ticks`
+    # The model can't be stepped from here while the window is running it
+    def iter_ticks(self, n_ticks: int, every: int = 1, **kwargs) -> Iterator[Snapshot]:
+        if self.worker is not None and self.worker.is_alive():
+            raise RuntimeError("The model is already being run by the window")
+        return self.model.iter_ticks(n_ticks, every, **kwargs)
+
+    # Draws the latest snapshot from the model, if there's a new one
+    def tick(self) -> None:
+        snapshot: Optional[Snapshot] = self.worker.take()
+        if snapshot is None:
+            return
+        self.show(snapshot)
+
+    # Draws a snapshot of the model, along with the statistics up to its time
+    def show(self, snapshot: Snapshot) -> None:
+        self.tick_map(snapshot)
+        if self.profiler is not None:
+            self.overlay.set_text(self.profiler.report())
+        # If any axes had to change, everything has to be drawn again
+        # Otherwise, only redraw what changed on top of the backgrounds
+        if self.tick_stats(snapshot.time) or len(self.backgrounds) == 0:
+            self.fig.canvas.draw_idle()
+            return
+        for ax, artists in self.animated.items():
+            self.fig.canvas.restore_region(self.backgrounds[ax])
+            for artist in artists:
+                ax.draw_artist(artist)
+            self.fig.canvas.blit(ax.bbox)
 
     # Handler for all our checkbox actions
     def checkbox_handler(self, _) -> None:
@@ -250,11 +296,59 @@ class Simulation:
         # Set our model accordingly
         self.paused = state[3]
         self.log_scale = state[0]
-        self.p_movement = 0.0 if state[1] else 0.6 if state[2] else 1.0
+        self.worker.pause(self.paused)
+        self.worker.set_p_movement(0.0 if state[1] else 0.6 if state[2] else 1.0)
+        # Changing the scale means redrawing the axes
+        if self.stats_ax.get_yscale() != ('log' if self.log_scale else 'linear'):
+            self.stats_ax.set_yscale('log' if self.log_scale else 'linear')
+            self.stats_ax.set_ylim(1 if self.log_scale else 0, self.stats_ax.get_ylim()[1])
+            self.fig.canvas.draw_idle()
+
+
+# Doubles the upper limit of some axes until a value fits, without going past
+#  some maximum
+# Returns whether it had to change
+def grow_limit(
+  get_limit: Callable,
+  set_limit: Callable,
+  value: float,
+  most: float = np.inf,
+) -> bool:
+    low, high = get_limit()
+    if value <= high:
+        return False
+    while value > high:
+        high *= 2
+    set_limit(low, min(high, most))
+    return True
 
 
 
 if __name__ == '__main__':
-    print(f"Seed: {np.random.get_state()}")
-    sim = Simulation()
+    parser = argparse.ArgumentParser(description='Run the simulation interactively')
+    parser.add_argument('--checkpoint', default=None, help='File to checkpoint to, and resume from if it exists')
+    parser.add_argument('--checkpoint-every', type=int, default=100, help='Timesteps between checkpoints')
+    parser.add_argument('--profile', nargs='?', const=True, default=False, help='Time each phase, and print the times at exit or write them to the given JSON file')
+    parser.add_argument('--profile-allocations', action='store_true', help='Also measure the memory each phase allocates')
+    args = parser.parse_args()
+    profiler: Optional[Profiler] = \
+        Profiler(args.profile_allocations, args.profile) \
+        if args.profile or args.profile_allocations else None
+
+    if args.checkpoint is not None and os.path.exists(args.checkpoint):
+        print(f"Resuming from {args.checkpoint}")
+        sim = Simulation(
+            model=load_checkpoint(args.checkpoint),
+            checkpoint=args.checkpoint,
+            checkpoint_every=args.checkpoint_every,
+            profiler=profiler)
+    else:
+        seed: int = np.random.SeedSequence().entropy
+        print(f"Seed: {seed}")
+        sim = Simulation(
+            seed=seed,
+            checkpoint=args.checkpoint,
+            checkpoint_every=args.checkpoint_every,
+            profiler=profiler)
+    import matplotlib.pyplot as plt
     plt.show()
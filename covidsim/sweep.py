@@ -0,0 +1,227 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Needed for running in parallel and saving results
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+
+# Needed for the random streams and the results
+import numpy as np
+# The model we're sweeping over
+from model import Model
+
+
+# Runs the model over a grid of parameters, with runs fanned out over every
+#  core
+# Every run gets its own random stream, derived from one master seed and the
+#  index of the run in the grid. That means a run always gives the same result
+#  no matter which worker it lands on or what order things finish in.
+# Each finished run is written to its own file in the output directory as soon
+#  as it's done. Runs that already have a file are skipped, so an interrupted
+#  sweep can be restarted without recomputing anything.
+# Runs are only identified by their index, so the output directory also holds
+#  a manifest of the seed, grid and settings it was started with. Resuming
+#  with anything different is refused, rather than mixing up results.
+
+
+# The parameters that can be swept over, in the order they vary
+PARAMETERS: List[str] = [
+    'p_infect',
+    'infection_distance',
+    'infection_time',
+    'p_recover',
+    'hospital_beds_ratio',
+    'p_movement',
+]
+
+# The time series saved for every run
+SERIES: List[str] = ['infected', 'recovered', 'dead', 'new_cases']
+
+
+# Every combination of parameters in the grid, along with its index
+# Parameters missing from the grid are left at the model's defaults
+def cells(grid: Dict[str, List[Any]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    names: List[str] = [p for p in PARAMETERS if p in grid]
+    for index, values in enumerate(itertools.product(*(grid[p] for p in names))):
+        yield index, dict(zip(names, values))
+
+# Where the results for a given run go
+def run_path(out_dir: str, index: int) -> str:
+    return os.path.join(out_dir, f'run-{index:06d}.npz')
+
+
+# Where the manifest goes
+def manifest_path(out_dir: str) -> str:
+    return os.path.join(out_dir, 'manifest.json')
+
+# Reads the manifest of an output directory, if it has one
+def read_manifest(out_dir: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(manifest_path(out_dir)):
+        return None
+    with open(manifest_path(out_dir)) as f:
+        return json.load(f)
+
+# Writes the manifest for a sweep, or checks it against the one that's already
+#  there
+def check_manifest(out_dir: str, manifest: Dict[str, Any]) -> None:
+    # Round trip it, so it compares the same way it was read
+    manifest = json.loads(json.dumps(manifest))
+    existing: Optional[Dict[str, Any]] = read_manifest(out_dir)
+    if existing is None:
+        with open(manifest_path(out_dir) + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path(out_dir) + '.tmp', manifest_path(out_dir))
+        return
+    different: List[str] = \
+        sorted(k for k in set(existing) | set(manifest) if existing.get(k) != manifest.get(k))
+    if len(different) > 0:
+        raise ValueError(
+            f"{out_dir} holds a sweep with a different {', '.join(different)}, "
+            "so it can't be resumed with these settings")
+
+
+# Does a single run and saves its results
+# This is what gets sent to the worker processes, so it has to be at the top
+#  level of the module
+def run_cell(
+  out_dir: str,
+  master_seed: int,
+  index: int,
+  params: Dict[str, Any],
+  n_ticks: int,
+  model_args: Dict[str, Any],
+) -> int:
+    seed: np.random.SeedSequence = np.random.SeedSequence(master_seed, spawn_key=(index,))
+    model: Model = Model(seed=seed, **model_args, **params)
+    # Stop early if the epidemic dies out, since nothing changes after that
+    for _ in range(n_ticks):
+        model.step()
+        if model.infected[-1] == 0:
+            break
+    # Write to a temporary file first, then move it into place. That way an
+    #  interruption can never leave a half-written result that looks finished.
+    path: str = run_path(out_dir, index)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez_compressed(
+            f,
+            index=index,
+            **{p: v for p, v in params.items()},
+            **{s: np.asarray(getattr(model, s), dtype=np.uint32) for s in SERIES})
+    os.replace(path + '.tmp', path)
+    return index
+
+
+# Runs every cell in the grid that doesn't already have results
+def sweep(
+  grid: Dict[str, List[Any]],
+  out_dir: str,
+  master_seed: int,
+  n_ticks: int = 500,
+  workers: int = None,
+  **model_args,
+) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    check_manifest(out_dir, {
+        'seed': int(master_seed),
+        'grid': {p: list(v) for p, v in grid.items()},
+        'n_ticks': n_ticks,
+        'model_args': model_args,
+    })
+    todo: List[Tuple[int, Dict[str, Any]]] = \
+        [(i, p) for i, p in cells(grid) if not os.path.exists(run_path(out_dir, i))]
+    print(f"{len(todo)} runs to do")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_cell, out_dir, master_seed, i, p, n_ticks, model_args)
+            for i, p in todo
+        ]
+        for done, future in enumerate(concurrent.futures.as_completed(futures)):
+            print(f"Finished run {future.result()} ({done+1}/{len(todo)})")
+    write_summary(out_dir)
+
+
+# Loads every finished run in the output directory
+# Returns the parameters as arrays with one entry per run, and the time series
+#  as (runs, time) arrays. Runs that ended early are padded with their last
+#  value, since nothing changes once the epidemic is over.
+def load_results(out_dir: str) -> Dict[str, np.ndarray]:
+    paths: List[str] = sorted(
+        os.path.join(out_dir, f) for f in os.listdir(out_dir)
+        if f.startswith('run-') and f.endswith('.npz'))
+    runs: List[Dict[str, np.ndarray]] = []
+    for path in paths:
+        with np.load(path) as data:
+            runs.append({k: data[k] for k in data.files})
+    if len(runs) == 0:
+        return {}
+    length: int = max(len(r[SERIES[0]]) for r in runs)
+    results: Dict[str, np.ndarray] = {}
+    for key in runs[0]:
+        if key in SERIES:
+            results[key] = np.stack([
+                np.pad(r[key], (0, length - len(r[key])), mode='edge')
+                if key != 'new_cases' else
+                np.pad(r[key], (0, length - len(r[key])))
+                for r in runs
+            ])
+        else:
+            results[key] = np.array([r[key] for r in runs])
+    return results
+
+# Writes a table with one row per run, summarizing how it went
+def write_summary(out_dir: str) -> None:
+    results: Dict[str, np.ndarray] = load_results(out_dir)
+    if len(results) == 0:
+        return
+    params: List[str] = [p for p in PARAMETERS if p in results]
+    with open(os.path.join(out_dir, 'summary.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['index'] + params + ['peak_infected', 'peak_time', 'recovered', 'dead'])
+        for i in range(len(results['index'])):
+            writer.writerow(
+                [results['index'][i]] + \
+                [results[p][i] for p in params] + \
+                [
+                    results['infected'][i].max(),
+                    results['infected'][i].argmax() + 1,
+                    results['recovered'][i,-1],
+                    results['dead'][i,-1],
+                ])
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep the model over a grid of parameters')
+    parser.add_argument('out_dir', help='Directory to put the results in')
+    parser.add_argument('--seed', type=int, default=None, help='Master seed for the whole sweep')
+    parser.add_argument('--ticks', type=int, default=500, help='Maximum timesteps per run')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes to use')
+    parser.add_argument('--pop-size', type=int, default=5000)
+    for p in PARAMETERS:
+        parser.add_argument('--' + p.replace('_', '-'), type=float, nargs='+')
+    args = parser.parse_args()
+
+    # If we're not given a seed, pick up the one from the sweep we're
+    #  resuming, or make one up and tell the user
+    manifest: Optional[Dict[str, Any]] = \
+        read_manifest(args.out_dir) if os.path.isdir(args.out_dir) else None
+    seed: int = \
+        args.seed if args.seed is not None else \
+        manifest['seed'] if manifest is not None else \
+        np.random.SeedSequence().entropy
+    print(f"Seed: {seed}")
+
+    grid: Dict[str, List[Any]] = {}
+    for p in PARAMETERS:
+        values: List[float] = getattr(args, p)
+        if values is not None:
+            grid[p] = [int(v) for v in values] if p == 'infection_time' else values
+    try:
+        sweep(grid, args.out_dir, seed, args.ticks, args.workers, pop_size=args.pop_size)
+    except ValueError as e:
+        parser.error(str(e))
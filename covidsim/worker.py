@@ -0,0 +1,89 @@
+# Nice to have type hinting
+from __future__ import annotations
+from typing import Callable, List, Optional
+
+# Needed for running in the background
+import queue
+import threading
+
+# The model we're running
+from model import Model, Snapshot
+# Needed for saving runs as they go
+from checkpoint import Checkpointer
+
+
+# The fields of each snapshot that the window draws
+DRAWN: List[str] = ['positions', 'healths']
+
+# Runs a model flat out on a background thread
+# The model only ever gets touched from this thread. Anyone else talks to it
+#  by sending commands, which get run between steps, and sees it through the
+#  latest snapshot that was published. A new snapshot is only copied out once
+#  the last one has been taken, so a slow reader just sees fewer of them and
+#  never holds the model up.
+class ModelWorker(threading.Thread):
+
+    def __init__(
+      self,
+      model: Model,
+      checkpointer: Optional[Checkpointer] = None,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.model: Model = model
+        self.checkpointer: Optional[Checkpointer] = checkpointer
+        self.commands: queue.Queue = queue.Queue()
+        self.paused: bool = False
+        self.stopped: bool = False
+        # The latest snapshot, and whether the reader wants a new one
+        self.latest: Optional[Snapshot] = model.snapshot(fields=DRAWN)
+        self.wanted: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped:
+            # Run any commands we've been sent
+            # If we're paused, there's nothing else to do, so wait for one
+            try:
+                command: Callable[[ModelWorker], None] = \
+                    self.commands.get(block=self.paused)
+                command(self)
+                continue
+            except queue.Empty:
+                pass
+            self.model.step()
+            if self.checkpointer is not None:
+                self.checkpointer.tick()
+            if self.wanted.is_set():
+                self.wanted.clear()
+                self.latest = self.model.snapshot(fields=DRAWN)
+
+    # Sends a command to be run on the worker thread
+    # The command is called with the worker
+    def send(self, command: Callable[[ModelWorker], None]) -> None:
+        self.commands.put(command)
+
+    def pause(self, paused: bool) -> None:
+        def command(worker: ModelWorker) -> None:
+            worker.paused = paused
+        self.send(command)
+
+    def set_p_movement(self, p_movement: float) -> None:
+        def command(worker: ModelWorker) -> None:
+            worker.model.p_movement = p_movement
+        self.send(command)
+
+    # Takes the latest snapshot, or `None` if there hasn't been a new one
+    #  since the last time
+    def take(self) -> Optional[Snapshot]:
+        snapshot: Optional[Snapshot] = self.latest
+        self.latest = None
+        self.wanted.set()
+        return snapshot
+
+    # Stops the worker and waits for it to finish its current step
+    def stop(self) -> None:
+        def command(worker: ModelWorker) -> None:
+            worker.stopped = True
+        self.send(command)
+        self.join()
+        if self.checkpointer is not None:
+            self.checkpointer.close()